@@ -1,13 +1,18 @@
 import streamlit as st
-from PIL import Image
 import time
 import hashlib
+import os
+import threading
+import uuid
 
 from processing.intensity import negative, log_transform, gamma_correction, piecewise_linear
-from processing.histogram import hist_equalization, clahe_equalization, ahe_equalization, ahe_equalization_fast
-from processing.applications import enhance_license_plate, enhance_satellite_image, enhance_low_light_image
-from utils.image_io import pil_to_np, np_to_pil
-from utils.plot import plot_histogram
+from utils.image_io import np_to_pil, decode_within, decode_peak_nbytes
+from utils.memory import GovernedCache, governor
+from utils.profiling import profiled
+from utils.plot import plot_histogram, plot_lut_histogram
+from utils.pyramid import pyramid_for
+from service.client import JobClient, JobError
+from service.pipelines import run_pipeline
 
 # Cấu hình Streamlit cơ bản
 st.set_page_config(
@@ -22,226 +27,521 @@ def cached_image_processing(img_hash, method, params):
     """Cache kết quả xử lý ảnh để tránh tính toán lại"""
     return None  # Placeholder - sẽ được override bởi logic thực tế
 
+# Ảnh hiển thị (preview) không cần lớn hơn ~2MP
+PREVIEW_MAX_PIXELS = 2000000
+
+@st.cache_resource(show_spinner=False)
+def upload_cache():
+    """Ảnh upload đã giải mã, dùng chung giữa các session (giới hạn bởi governor bộ nhớ)"""
+    return GovernedCache("upload", max_items=4)
+
+def decode_upload(data, key=None):
+    """
+    Giải mã ảnh upload một lần; cùng một mảng được dùng lại qua các lần rerun
+    nên pyramid của nó (utils.pyramid) cũng được dùng lại.
+
+    Ảnh giải mã lớn hơn giới hạn mỗi upload của governor được giải mã ở một mức
+    pyramid nhỏ hơn. Trả về (mảng, k) - k là số mức đã giảm (0 = độ phân giải gốc).
+    key: khóa cache có sẵn (vd. utils.thumbnails.source_key), mặc định là hash nội dung.
+    """
+    key = key or hashlib.md5(data).hexdigest()
+    entry = upload_cache().get(key)
+    if entry is None:
+        limit = governor().upload_limit()
+        # Giải phóng chỗ (bỏ các mục cũ nhất) cho bộ nhớ đỉnh khi giải mã
+        governor().reserve(decode_peak_nbytes(data, limit))
+        entry = decode_within(data, limit)
+        upload_cache()[key] = entry
+    return entry
+
 def get_image_hash(img_array):
     """Tạo hash cho ảnh để cache"""
     return hashlib.md5(img_array.tobytes()).hexdigest()[:8]
 
-st.title("Xử lý ảnh - Tiểu luận 1")
+@st.cache_resource(show_spinner=False)
+def gallery_cache():
+    """
+    Thumbnail và preview của gallery, dùng chung giữa các session và các lần rerun:
+    khóa (khóa nguồn, size) -> thumbnail, (khóa nguồn, size, pipeline) -> preview.
+    """
+    return GovernedCache("gallery")
 
-uploaded_file = st.file_uploader("Chọn ảnh...", type=["jpg", "png", "jpeg"])
+@st.cache_resource(show_spinner=False)
+def start_warm_up():
+    """
+    Calibration (chọn backend và cost model của planner, vài giây khi máy chưa có cache) chạy
+    một lần cho cả tiến trình trong thread nền, ngay sau khi trang đầu render - không nằm trong
+    request xử lý ảnh nào. Tắt bằng TIEU_LUAN_WARM_UP=0.
+    """
+    if os.environ.get("TIEU_LUAN_WARM_UP", "1") == "0":
+        return None
+    from processing import planner
+    thread = threading.Thread(target=planner.warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
 
-if uploaded_file:
-    image = Image.open(uploaded_file)
-    img = pil_to_np(image)
-    
-    tab1, tab2, tab3 = st.tabs(["Biến đổi cường độ sáng", "Cân bằng histogram", "Ứng dụng thực tế"])
-    
-    with tab1:
-        method = st.selectbox(
-            "Chọn phương pháp cường độ sáng",
-            ["Negative", "Log", "Gamma/Power-law", "Piecewise-linear"],
-        )
+@st.cache_resource(show_spinner=False)
+def get_job_client():
+    """Trả về client nếu job server đang chạy, ngược lại None (xử lý inline)"""
+    client = JobClient()
+    return client if client.available() else None
 
-        # Xử lý các phương pháp biến đổi cơ bản
-        import cv2
-        if method == "Gamma/Power-law":
-            st.caption("Power-law transformation: s = c * r^γ")
-            col_c, col_g = st.columns(2)
-            with col_c:
-                c_val = st.slider("Hằng số c", 0.1, 3.0, 1.0, 0.1)
-            with col_g:
-                gamma_val = st.slider("Tham số γ (gamma)", 0.1, 3.0, 1.0, 0.1)
-            processed = gamma_correction(img, gamma_val, c_val)
-            display_original = image
-        elif method == "Piecewise-linear":
-            st.caption("Biến đổi tuyến tính từng đoạn (contrast stretching)")
-            col_a, col_b = st.columns(2)
-            with col_a:
-                r1 = st.slider("r1", 0, 255, 50)
-                r2 = st.slider("r2", 0, 255, 200)
-            with col_b:
-                s1 = st.slider("s1", 0, 255, 20)
-                s2 = st.slider("s2", 0, 255, 230)
-            # Đảm bảo r2 > r1 hợp lệ (hàm xử lý cũng tự bảo vệ)
-            processed = piecewise_linear(img, r1, s1, r2, s2)
-            display_original = image
-        elif method == "Negative":
-            processed = negative(img)
-            display_original = image
-        elif method == "Log":
-            st.caption("Log transformation: s = c * log(1 + r)")
-            c_val = st.slider("Hằng số c (range rộng để thấy rõ khác biệt)", 0.1, 50.0, 1.0, 0.1)
-            processed = log_transform(img, c_val)
-            display_original = image
-
-        # Hiển thị ảnh gốc và ảnh sau biến đổi song song nhau
-        st.subheader("So sánh kết quả")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.image(display_original, caption="Ảnh gốc", use_container_width=True)
-        with col2:
-            st.image(processed, caption=f"Ảnh sau {method}", use_container_width=True)
-            
-        # Hiển thị histogram gốc và histogram sau biến đổi song song
-        st.subheader("So sánh histogram")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.image(plot_histogram(img), caption="Histogram gốc", use_container_width=True)
-        with col2:
-            st.image(plot_histogram(processed), caption=f"Histogram sau {method}", use_container_width=True)
-            
-        # Tạo phần tải xuống ở giữa màn hình
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            # Tải xuống ảnh kết quả
-            result_pil = np_to_pil(processed)
-            st.download_button("📥 Tải ảnh kết quả", 
-                            data=result_pil.tobytes(),
-                            file_name=f"result_{method}.png",
-                            mime="image/png",
-                            key="download_intensity")
-    with tab2:
-        st.caption("Cân bằng lược đồ mức xám (Histogram Equalization / AHE / CLAHE)")
-        he_method = st.selectbox("Chọn phương pháp cân bằng", ["Histogram Equalization", "AHE", "CLAHE"]) 
-        import cv2
-        gray_img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY) if len(img.shape) == 3 else img
-        if he_method == "Histogram Equalization":
-            processed_he = hist_equalization(gray_img)
-        elif he_method == "AHE":
-            st.info("📊 AHE với parameters tự động tối ưu dựa trên đặc điểm ảnh")
-            
-            # Tùy chọn manual override
-            manual_params = st.checkbox("🔧 Tùy chỉnh parameters thủ công", value=False)
+def run_job(img_array, pipeline, params=None, on_progress=None):
+    """
+    Gửi tác vụ nặng tới job server và poll kết quả.
+    Nếu server không chạy (hoặc đang bật profiling) thì tính trực tiếp trong script thread.
+    """
+    client = get_job_client() if profile_mode() is None else None
+    if client is not None:
+        try:
+            return client.run(img_array, pipeline, params, on_progress=on_progress)
+        except (OSError, JobError):
+            get_job_client.clear()
+    return run_pipeline(pipeline, img_array, params)
+
+# Các phép xử lý dùng trong chế độ gallery: tên hiển thị -> pipeline
+GALLERY_OPERATIONS = {
+    "Ảnh gốc": None,
+    "Negative": "negative",
+    "Histogram Equalization": "hist_equalization",
+    "CLAHE": "clahe",
+    "Xử lý biển số xe": "license_plate",
+    "Cải thiện ảnh vệ tinh": "satellite",
+    "Xử lý ảnh ánh sáng kém": "low_light",
+    "Khôi phục tài liệu": "document",
+}
+
+def render_gallery():
+    """
+    Chế độ gallery: nhiều ảnh upload hoặc một thư mục cục bộ.
+    Xem trước trên thumbnail (contact sheet), chỉ xử lý độ phân giải gốc cho ảnh được mở.
+    """
+    from utils.thumbnails import list_images, load_thumbnails, read_source
+
+    uploads = st.file_uploader("Chọn nhiều ảnh...", type=["jpg", "png", "jpeg"],
+                               accept_multiple_files=True)
+    directory = st.text_input("...hoặc đường dẫn thư mục ảnh trên máy chủ", value="")
+    sources = list(uploads or [])
+    if directory:
+        try:
+            sources += list_images(directory)
+        except OSError as e:
+            st.error(f"Không đọc được thư mục: {e}")
+    if not sources:
+        return
+
+    col_op, col_size = st.columns([3, 1])
+    with col_op:
+        operation = st.selectbox("Phép xử lý", list(GALLERY_OPERATIONS))
+    with col_size:
+        thumb_size = st.select_slider("Kích thước thumbnail", [128, 192, 256, 384], value=256)
+    pipeline = GALLERY_OPERATIONS[operation]
+
+    with st.spinner(f"Đang tạo thumbnail cho {len(sources)} ảnh..."):
+        items = load_thumbnails(sources, thumb_size, cache=gallery_cache())
+    failed = [name for name, _, thumb in items if thumb is None]
+    if failed:
+        st.warning(f"Không đọc được {len(failed)} ảnh: {', '.join(failed)}")
+    items = [(source, *item) for source, item in zip(sources, items) if item[2] is not None]
+    if not items:
+        return
+
+    n_cols = 4
+    for start in range(0, len(items), n_cols):
+        cols = st.columns(n_cols)
+        for col, (_, name, key, thumb) in zip(cols, items[start:start + n_cols]):
+            preview = thumb
+            if pipeline is not None:
+                preview = gallery_cache().get((key, thumb_size, pipeline))
+                if preview is None:
+                    preview = run_pipeline(pipeline, thumb)
+                    gallery_cache()[(key, thumb_size, pipeline)] = preview
+            col.image(preview, caption=name, use_container_width=True)
+
+    # Chỉ ảnh được mở mới xử lý ở độ phân giải đầy đủ
+    names = [name for _, name, _, _ in items]
+    opened = st.selectbox("Mở ảnh (độ phân giải đầy đủ)", ["(không)"] + names)
+    if opened == "(không)":
+        return
+    source, _, key, _ = items[names.index(opened)]
+    # Giải mã qua cùng đường với ảnh upload: dành chỗ trong governor, giảm độ phân giải
+    # nếu vượt giới hạn mỗi ảnh, và dùng lại mảng đã giải mã qua các lần rerun
+    full, reduced_levels = decode_upload(read_source(source)[1], key)
+    if reduced_levels:
+        st.warning(f"Ảnh quá lớn so với ngân sách bộ nhớ: đang xử lý ở độ phân giải giảm "
+                   f"{2 ** reduced_levels} lần mỗi chiều ({full.shape[1]}x{full.shape[0]}).")
+    processed_full = full if pipeline is None else profile_run("gallery", lambda: run_job(full, pipeline))
+    c1, c2 = st.columns(2)
+    with c1:
+        st.image(full, caption=f"{opened} - ảnh gốc", use_container_width=True)
+    with c2:
+        st.image(processed_full, caption=f"{opened} - {operation}", use_container_width=True)
+
+# Ứng dụng thực tế: tên hiển thị -> (pipeline, mô tả)
+APPLICATIONS = {
+    "Xử lý biển số xe": (
+        "license_plate",
+        "Tiền xử lý ảnh biển số xe để tối ưu cho nhận dạng ký tự (OCR). Kết quả là ảnh nhị phân với ký tự rõ nét."),
+    "Cải thiện ảnh vệ tinh": (
+        "satellite",
+        "Cải thiện chất lượng ảnh vệ tinh để hỗ trợ phân tích trong các hệ thống thông tin địa lý (GIS)."),
+    "Xử lý ảnh ánh sáng kém": (
+        "low_light",
+        "🌙 Nâng cao chất lượng ảnh chụp trong điều kiện ánh sáng kém. Sử dụng HSV color space để bảo toàn màu sắc tự nhiên và tránh nhiễu màu."),
+    "Khôi phục tài liệu": (
+        "document",
+        "📄 Làm sạch ảnh tài liệu scan/chụp: ước lượng nền giấy (ố vàng, bóng đổ) bằng lấy mẫu thưa rồi nội suy, chia cho nền, sau đó gamma hoặc nhị phân hóa."),
+}
+
+# Lựa chọn profiling ở sidebar -> mode của utils.profiling
+PROFILE_MODES = {"Tắt": None, "Sampling": "sample", "cProfile": "cprofile"}
+
+def profile_mode():
+    return PROFILE_MODES[st.session_state.get("profile_mode", "Tắt")]
+
+def profile_run(label, compute):
+    """Chạy compute(); khi bật profiling thì chạy dưới profiler và giữ report cho sidebar"""
+    mode = profile_mode()
+    if mode is None:
+        return compute()
+    with profiled(mode) as report:
+        value = compute()
+    st.session_state["profile_report"] = (label, report)
+    return value
+
+def tab_result(tab, img_pyramid, params, compute):
+    """
+    Kết quả gần nhất của mỗi tab trong session: chỉ tính lại khi ảnh hoặc tham số đổi,
+    nên rerun do widget khác (hoặc chuyển tab) không chạy lại phép xử lý
+    """
+    # Hash ảnh tính một lần cho mỗi ảnh upload (nhớ trên pyramid)
+    # Bật/đổi chế độ profiling thì tính lại để có report
+    key = (img_pyramid.memo("hash", lambda: get_image_hash(img_pyramid.base)), params, profile_mode())
+    if "tab_results" not in st.session_state:
+        # Kết quả của session được tính vào ngân sách chung; governor có thể bỏ kết quả
+        # của session ít dùng gần đây nhất khi bộ nhớ đầy (sẽ được tính lại)
+        st.session_state["tab_results"] = GovernedCache(f"session:{uuid.uuid4().hex[:8]}")
+    results = st.session_state["tab_results"]
+    cached = results.get(tab)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    value = profile_run(tab, compute)
+    if value is not None:
+        results[tab] = (key, value)
+    return value
+
+def render_intensity_tab(img, image, img_pyramid):
+    method = st.selectbox(
+        "Chọn phương pháp cường độ sáng",
+        ["Negative", "Log", "Gamma/Power-law", "Piecewise-linear"],
+    )
+
+    # Xử lý các phương pháp biến đổi cơ bản
+    # LUT của phép biến đổi điểm -> histogram đầu ra suy ra từ histogram đầu vào
+    point_lut = None
+    if method == "Gamma/Power-law":
+        st.caption("Power-law transformation: s = c * r^γ")
+        col_c, col_g = st.columns(2)
+        with col_c:
+            c_val = st.slider("Hằng số c", 0.1, 3.0, 1.0, 0.1)
+        with col_g:
+            gamma_val = st.slider("Tham số γ (gamma)", 0.1, 3.0, 1.0, 0.1)
+        processed, point_lut = tab_result("intensity", img_pyramid, (method, gamma_val, c_val),
+                                           lambda: gamma_correction(img, gamma_val, c_val, return_lut=True))
+        display_original = image
+    elif method == "Piecewise-linear":
+        st.caption("Biến đổi tuyến tính từng đoạn (contrast stretching)")
+        col_a, col_b = st.columns(2)
+        with col_a:
+            r1 = st.slider("r1", 0, 255, 50)
+            r2 = st.slider("r2", 0, 255, 200)
+        with col_b:
+            s1 = st.slider("s1", 0, 255, 20)
+            s2 = st.slider("s2", 0, 255, 230)
+        # Đảm bảo r2 > r1 hợp lệ (hàm xử lý cũng tự bảo vệ)
+        processed, point_lut = tab_result("intensity", img_pyramid, (method, r1, s1, r2, s2),
+                                           lambda: piecewise_linear(img, r1, s1, r2, s2, return_lut=True))
+        display_original = image
+    elif method == "Negative":
+        processed, point_lut = tab_result("intensity", img_pyramid, (method,), lambda: negative(img, return_lut=True))
+        display_original = image
+    elif method == "Log":
+        st.caption("Log transformation: s = c * log(1 + r)")
+        c_val = st.slider("Hằng số c (range rộng để thấy rõ khác biệt)", 0.1, 50.0, 1.0, 0.1)
+        processed = tab_result("intensity", img_pyramid, (method, c_val), lambda: log_transform(img, c_val))
+        display_original = image
+
+    # Hiển thị ảnh gốc và ảnh sau biến đổi song song nhau
+    st.subheader("So sánh kết quả")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.image(display_original, caption="Ảnh gốc", use_container_width=True)
+    with col2:
+        st.image(processed, caption=f"Ảnh sau {method}", use_container_width=True)
+        
+    # Hiển thị histogram gốc và histogram sau biến đổi song song
+    st.subheader("So sánh histogram")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.image(plot_histogram(img, img_pyramid), caption="Histogram gốc", use_container_width=True)
+    with col2:
+        processed_hist = (plot_histogram(processed) if point_lut is None
+                          else plot_lut_histogram(img, point_lut, img_pyramid))
+        st.image(processed_hist, caption=f"Histogram sau {method}", use_container_width=True)
+        
+    # Tạo phần tải xuống ở giữa màn hình
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        # Tải xuống ảnh kết quả
+        result_pil = np_to_pil(processed)
+        st.download_button("📥 Tải ảnh kết quả", 
+                        data=result_pil.tobytes(),
+                        file_name=f"result_{method}.png",
+                        mime="image/png",
+                        key="download_intensity")
+
+def render_histogram_tab(img, image, img_pyramid):
+    st.caption("Cân bằng lược đồ mức xám (Histogram Equalization / AHE / CLAHE)")
+    he_method = st.selectbox("Chọn phương pháp cân bằng", ["Histogram Equalization", "AHE", "CLAHE"]) 
+    from processing import backends
+    # Ảnh xám tính một lần cho mỗi ảnh upload (nhớ trên pyramid)
+    gray_img = img_pyramid.memo("gray", lambda: backends.rgb_to_gray(img)) if len(img.shape) == 3 else img
+    gray_pyramid = pyramid_for(gray_img)
+    he_lut = None
+    if he_method == "Histogram Equalization":
+        # Một lần tra bảng - chạy trực tiếp, không cần gửi ảnh tới job server
+        from processing.histogram import hist_equalization
+        processed_he, he_lut = tab_result("histogram", img_pyramid, (he_method,),
+                                          lambda: hist_equalization(gray_img, return_lut=True))
+    elif he_method == "AHE":
+        st.info("📊 AHE với parameters tự động tối ưu dựa trên đặc điểm ảnh")
+        
+        # Tùy chọn manual override
+        manual_params = st.checkbox("🔧 Tùy chỉnh parameters thủ công", value=False)
+        
+        if manual_params:
+            col_win, col_fast = st.columns(2)
+            with col_win:
+                window = st.slider("Window Size", 16, 128, 64, 16)
+            with col_fast:
+                step_size = st.slider("Step Size (tăng để nhanh hơn)", 4, 16, 8, 2)
             
-            if manual_params:
-                col_win, col_fast = st.columns(2)
-                with col_win:
-                    window = st.slider("Window Size", 16, 128, 64, 16)
-                with col_fast:
-                    step_size = st.slider("Step Size (tăng để nhanh hơn)", 4, 16, 8, 2)
-                
-                processed_he = ahe_equalization_fast(gray_img, window, step_size)
-            else:
-                # Sử dụng auto parameters
-                st.success("✅ Sử dụng parameters tự động tối ưu")
-                processed_he = ahe_equalization_fast(gray_img)
-        else:  # CLAHE
-            clip = st.slider("Clip Limit", 1.0, 5.0, 2.0, 0.1)
-            grid = st.slider("Tile Grid Size", 4, 16, 8, 1)
-            processed_he = clahe_equalization(gray_img, clip, grid)
-
-        # So sánh ảnh gốc (xám) và ảnh sau HE/CLAHE
-        st.subheader("So sánh kết quả")
-        c1, c2 = st.columns(2)
-        with c1:
-            st.image(gray_img, caption="Ảnh gốc (grayscale)", use_container_width=True)
-        with c2:
-            st.image(processed_he, caption=f"Ảnh sau {he_method}", use_container_width=True)
-
-        st.subheader("So sánh histogram")
-        c1, c2 = st.columns(2)
-        with c1:
-            st.image(plot_histogram(gray_img), caption="Histogram gốc", use_container_width=True)
-        with c2:
-            st.image(plot_histogram(processed_he), caption=f"Histogram sau {he_method}", use_container_width=True)
-
-        # Nút tải xuống
-        d1, d2, d3 = st.columns([1, 2, 1])
-        with d2:
-            result_pil = np_to_pil(processed_he)
-            st.download_button(
-                "📥 Tải ảnh kết quả",
-                data=result_pil.tobytes(),
-                file_name=f"result_{he_method}.png",
-                mime="image/png",
-                key="download_hist",
+            ahe_params = {"window_size": window, "step_size": step_size}
+            processed_he = tab_result("histogram", img_pyramid, ("ahe", ahe_params),
+                                      lambda: run_job(gray_img, "ahe", ahe_params))
+        else:
+            # Planner chọn biến thể (exact / grid / thu nhỏ) theo ngân sách thời gian
+            from processing.histogram import auto_optimize_ahe_params
+            from processing.planner import plan_ahe
+            budget = st.slider("Ngân sách thời gian (giây)", 0.5, 10.0, 2.0, 0.5)
+            auto_window, _ = auto_optimize_ahe_params(gray_img)
+            plan = plan_ahe(gray_img.shape, budget, window_size=auto_window)
+            pipeline = "ahe_exact" if plan.algorithm == "ahe_exact" else "ahe"
+            def run_planned():
+                t_start = time.perf_counter()
+                return run_job(gray_img, pipeline, plan.params), time.perf_counter() - t_start
+            processed_he, elapsed = tab_result("histogram", img_pyramid, (pipeline, plan.params), run_planned)
+            st.success(
+                f"✅ Plan: {plan.algorithm} {plan.params} - dự đoán {plan.predicted_s:.2f}s, "
+                f"thực tế {elapsed:.2f}s"
             )
-    with tab3:
-        application = st.selectbox(
-            "Chọn ứng dụng thực tế",
-            ["Xử lý biển số xe", "Cải thiện ảnh vệ tinh", "Xử lý ảnh ánh sáng kém"]
+    else:  # CLAHE
+        clip = st.slider("Clip Limit", 1.0, 5.0, 2.0, 0.1)
+        grid = st.slider("Tile Grid Size", 4, 16, 8, 1)
+        processed_he = tab_result("histogram", img_pyramid, ("clahe", clip, grid),
+                                  lambda: run_job(gray_img, "clahe", {"clip": clip, "grid": grid}))
+
+    # So sánh ảnh gốc (xám) và ảnh sau HE/CLAHE
+    st.subheader("So sánh kết quả")
+    c1, c2 = st.columns(2)
+    with c1:
+        st.image(gray_pyramid.level_for_pixels(PREVIEW_MAX_PIXELS), caption="Ảnh gốc (grayscale)", use_container_width=True)
+    with c2:
+        st.image(processed_he, caption=f"Ảnh sau {he_method}", use_container_width=True)
+
+    st.subheader("So sánh histogram")
+    c1, c2 = st.columns(2)
+    with c1:
+        st.image(plot_histogram(gray_img, gray_pyramid), caption="Histogram gốc", use_container_width=True)
+    with c2:
+        processed_hist = (plot_histogram(processed_he) if he_lut is None
+                          else plot_lut_histogram(gray_img, he_lut, gray_pyramid))
+        st.image(processed_hist, caption=f"Histogram sau {he_method}", use_container_width=True)
+
+    # Nút tải xuống
+    d1, d2, d3 = st.columns([1, 2, 1])
+    with d2:
+        result_pil = np_to_pil(processed_he)
+        st.download_button(
+            "📥 Tải ảnh kết quả",
+            data=result_pil.tobytes(),
+            file_name=f"result_{he_method}.png",
+            mime="image/png",
+            key="download_hist",
         )
-        
+
+def render_application_tab(img, image, img_pyramid):
+    application = st.selectbox(
+        "Chọn ứng dụng thực tế",
+        list(APPLICATIONS)
+    )
+
+    app_params = {}
+    if application == "Khôi phục tài liệu":
+        d1, d2, d3 = st.columns(3)
+        app_params["cell_size"] = d1.select_slider("Kích thước ô nền", [16, 32, 64, 128, 256], value=64)
+        app_params["gamma"] = d2.slider("Gamma (làm đậm chữ)", 0.5, 3.0, 1.5, 0.1)
+        app_params["invert"] = d3.checkbox("Ảnh âm bản (chữ sáng, nền tối)", value=False)
+        app_params["binarize"] = d3.checkbox("Nhị phân hóa", value=False)
+        if app_params["binarize"]:
+            app_params["threshold"] = d2.slider("Ngưỡng (tỉ lệ so với nền)", 0.5, 0.95, 0.8, 0.05)
+
+    # Chỉ xử lý vùng quan tâm (ROI): chi phí tỉ lệ với diện tích vùng chọn
+    if st.checkbox("🎯 Chỉ xử lý vùng quan tâm (ROI)", value=False):
+        img_h, img_w = img.shape[:2]
+        r1, r2, r3, r4 = st.columns(4)
+        roi_x = r1.number_input("x", 0, img_w - 1, 0)
+        roi_y = r2.number_input("y", 0, img_h - 1, 0)
+        roi_w = r3.number_input("Rộng", 1, img_w, min(img_w, 200))
+        roi_h = r4.number_input("Cao", 1, img_h, min(img_h, 60))
+        app_params["rois"] = [[int(roi_x), int(roi_y), int(roi_w), int(roi_h)]]
+    
+    pipeline, description = APPLICATIONS[application]
+    st.info(description)
+
+    def process():
         # Hiển thị progress bar khi xử lý
         progress_container = st.empty()
-        
+
         with progress_container:
             progress_bar = st.progress(0)
             status_text = st.empty()
-            
+
+            def show_job_progress(status):
+                # Progress từ job server: 30% -> 100%
+                progress_bar.progress(30 + int(70 * status["progress"]))
+                status_text.text(f"Job {status['state']} ({status['elapsed']:.1f}s)...")
+
             try:
-                if application == "Xử lý biển số xe":
-                    st.info("Tiền xử lý ảnh biển số xe để tối ưu cho nhận dạng ký tự (OCR). Kết quả là ảnh nhị phân với ký tự rõ nét.")
-                    
-                    status_text.text("Processing license plate...")
-                    progress_bar.progress(30)
-                    processed = enhance_license_plate(img)
-                    
-                elif application == "Cải thiện ảnh vệ tinh":
-                    st.info("Cải thiện chất lượng ảnh vệ tinh để hỗ trợ phân tích trong các hệ thống thông tin địa lý (GIS).")
-                    
-                    status_text.text("Processing satellite image...")
-                    progress_bar.progress(30)
-                    processed = enhance_satellite_image(img)
-                    
-                elif application == "Xử lý ảnh ánh sáng kém":
-                    st.info("🌙 Nâng cao chất lượng ảnh chụp trong điều kiện ánh sáng kém. Sử dụng HSV color space để bảo toàn màu sắc tự nhiên và tránh nhiễu màu.")
-                    
-                    status_text.text("Processing low-light image...")
-                    progress_bar.progress(30)
-                    processed = enhance_low_light_image(img)
-                
-                progress_bar.progress(70)
-                status_text.text("Preparing output...")
-                
-                progress_bar.progress(100)
-                status_text.text("✅ Processing completed!")
-                
-                # Clear progress after delay
-                time.sleep(0.5)
+                status_text.text(f"Processing {pipeline}...")
+                progress_bar.progress(30)
+                processed = run_job(img, pipeline, app_params, on_progress=show_job_progress)
                 progress_container.empty()
-                
+                return processed
             except Exception as e:
                 progress_container.empty()
                 st.error(f"Error during processing: {str(e)}")
                 st.error("Please try with a different image.")
+                return None
 
-        # Bảo đảm ảnh hiển thị luôn hợp lệ (kể cả khi là ảnh xám/nhị phân)
-        import cv2
-        import numpy as np
-        if processed is None:
-            processed_safe = img
-        else:
-            processed_safe = np.array(processed)
-            if processed_safe.dtype != np.uint8:
-                processed_safe = np.clip(processed_safe, 0, 255).astype(np.uint8)
-        # For display, convert gray => RGB to avoid theme quirks
-        processed_vis = (
-            cv2.cvtColor(processed_safe, cv2.COLOR_GRAY2RGB)
-            if processed_safe.ndim == 2
-            else processed_safe
-        )
+    # Chỉ chạy lại pipeline khi ảnh, ứng dụng hoặc tham số thay đổi
+    processed = tab_result("application", img_pyramid, (application, app_params), process)
 
-        st.subheader("So sánh kết quả")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.image(image, caption="Ảnh gốc", use_container_width=True)
-        with col2:
-            st.image(processed_vis, caption=f"Ảnh sau khi xử lý ({application})", use_container_width=True)
-            
-        st.subheader("So sánh histogram")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.image(plot_histogram(img), caption="Histogram gốc", use_container_width=True)
-        with col2:
-            st.image(plot_histogram(processed_safe), caption="Histogram sau xử lý", use_container_width=True)
+    # Bảo đảm ảnh hiển thị luôn hợp lệ (kể cả khi là ảnh xám/nhị phân)
+    import cv2
+    import numpy as np
+    if processed is None:
+        processed_safe = img
+    else:
+        processed_safe = np.asarray(processed)
+        if processed_safe.dtype != np.uint8:
+            processed_safe = np.clip(processed_safe, 0, 255).astype(np.uint8)
+    # For display, convert gray => RGB to avoid theme quirks
+    processed_vis = (
+        cv2.cvtColor(processed_safe, cv2.COLOR_GRAY2RGB)
+        if processed_safe.ndim == 2
+        else processed_safe
+    )
+
+    st.subheader("So sánh kết quả")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.image(image, caption="Ảnh gốc", use_container_width=True)
+    with col2:
+        st.image(processed_vis, caption=f"Ảnh sau khi xử lý ({application})", use_container_width=True)
         
-        # Tạo phần tải xuống ở giữa màn hình
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            result_pil = np_to_pil(processed_safe)
-            st.download_button("📥 Tải ảnh kết quả", 
-                            data=result_pil.tobytes(),
-                            file_name=f"result_{application}.jpg",
-                            mime="image/jpeg",
-                            key="download_application")
+    st.subheader("So sánh histogram")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.image(plot_histogram(img, img_pyramid), caption="Histogram gốc", use_container_width=True)
+    with col2:
+        st.image(plot_histogram(processed_safe), caption="Histogram sau xử lý", use_container_width=True)
+    
+    # Tạo phần tải xuống ở giữa màn hình
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        result_pil = np_to_pil(processed_safe)
+        st.download_button("📥 Tải ảnh kết quả", 
+                        data=result_pil.tobytes(),
+                        file_name=f"result_{application}.jpg",
+                        mime="image/jpeg",
+                        key="download_application")
+
+def render_memory_usage():
+    """Bộ nhớ đang dùng bởi các cache (governor chung của tiến trình) - để giám sát"""
+    usage = governor().usage()
+    mb = 1024 * 1024
+    with st.sidebar.expander("💾 Bộ nhớ cache"):
+        st.progress(min(usage["used_bytes"] / usage["budget_bytes"], 1.0),
+                    text=f"{usage['used_bytes'] / mb:.1f} / {usage['budget_bytes'] / mb:.0f} MB")
+        st.caption(f"{usage['entries']} mục, {usage['evictions']} lần bỏ")
+        for group, nbytes in sorted(usage["by_group"].items()):
+            st.caption(f"{group}: {nbytes / mb:.1f} MB")
+
+def render_profile_report():
+    """Các hàm nóng nhất và file xuất (collapsed stack, flame graph, .prof) của lần profiling gần nhất"""
+    if profile_mode() is None or "profile_report" not in st.session_state:
+        return
+    label, report = st.session_state["profile_report"]
+    with st.sidebar.expander("🔬 Kết quả profiling", expanded=True):
+        st.caption(f"{label} - {report.mode}: {report.elapsed * 1000:.0f} ms")
+        st.dataframe([{"hàm": row["function"], "self ms": round(row["self_s"] * 1000, 1),
+                       "total ms": round(row["total_s"] * 1000, 1), "calls": row["calls"]}
+                      for row in report.top(15)], hide_index=True)
+        if report.stacks:
+            st.download_button("Flame graph (.svg)", report.flamegraph_svg(),
+                               file_name=f"{label}.svg", mime="image/svg+xml")
+            st.download_button("Collapsed stack (.folded)", report.collapsed(),
+                               file_name=f"{label}.folded", mime="text/plain")
+        if report.pstats_data is not None:
+            st.download_button("cProfile (.prof)", report.pstats_data,
+                               file_name=f"{label}.prof", mime="application/octet-stream")
+
+st.title("Xử lý ảnh - Tiểu luận 1")
+st.sidebar.selectbox("🔬 Profiling", list(PROFILE_MODES), key="profile_mode",
+                     help="Chạy phép xử lý dưới profiler và hiển thị các hàm tốn thời gian nhất")
+
+mode = st.radio("Chế độ", ["Một ảnh", "Gallery"], horizontal=True, label_visibility="collapsed")
+start_warm_up()
+if mode == "Gallery":
+    render_gallery()
+    render_profile_report()
+    render_memory_usage()
+    st.stop()
+
+uploaded_file = st.file_uploader("Chọn ảnh...", type=["jpg", "png", "jpeg"])
+
+if uploaded_file:
+    img, reduced_levels = decode_upload(uploaded_file.getvalue())
+    if reduced_levels:
+        st.warning(f"Ảnh quá lớn so với ngân sách bộ nhớ: đang xử lý ở độ phân giải giảm "
+                   f"{2 ** reduced_levels} lần mỗi chiều ({img.shape[1]}x{img.shape[0]}).")
+    # Pyramid dùng chung cho preview, histogram và các bước thu nhỏ của ảnh này
+    img_pyramid = pyramid_for(img)
+    image = img_pyramid.level_for_pixels(PREVIEW_MAX_PIXELS)
+
+    tab_labels = ["Biến đổi cường độ sáng", "Cân bằng histogram", "Ứng dụng thực tế"]
+    try:
+        # Lazy tabs: chỉ tab đang mở chạy phần xử lý của nó
+        tabs = st.tabs(tab_labels, key="main_tab", on_change="rerun")
+    except TypeError:
+        # Streamlit cũ không hỗ trợ on_change: mọi tab đều chạy như trước
+        tabs = st.tabs(tab_labels)
+    for tab, render in zip(tabs, (render_intensity_tab, render_histogram_tab, render_application_tab)):
+        # tab.open: True/False khi tabs theo dõi trạng thái, None khi không theo dõi
+        if getattr(tab, "open", None) is not False:
+            with tab:
+                render(img, image, img_pyramid)
+
+render_profile_report()
+render_memory_usage()
@@ -0,0 +1,118 @@
+"""
+Đo độ trễ rerun của app khi người dùng thay đổi một widget.
+
+Streamlit chạy lại toàn bộ script mỗi khi widget thay đổi; đo thời gian rerun trong
+các kịch bản:
+
+- gamma:  kéo slider gamma ở tab "Biến đổi cường độ sáng"
+- clahe:  kéo slider clip limit ở tab "Cân bằng histogram"
+- application: đổi ứng dụng ở tab "Ứng dụng thực tế"
+
+Ảnh được đọc từ file thay cho `st.file_uploader` (AppTest không upload được file).
+Có thể chỉ định `--app` tới app.py của một bản khác (ví dụ git worktree) để so sánh trước/sau.
+
+Chạy:
+    python -m benchmarks.bench_rerun --image img/thieusang.jpg --repeat 5
+"""
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPLOADER_LINE = 'uploaded_file = st.file_uploader("Chọn ảnh...", type=["jpg", "png", "jpeg"])'
+
+
+def _patched_app(app_path, image_path):
+    """Bản sao app.py (cùng thư mục) đọc ảnh từ file thay cho file uploader"""
+    with open(app_path, encoding="utf-8") as f:
+        source = f.read()
+    if UPLOADER_LINE not in source:
+        raise RuntimeError("Không tìm thấy dòng file_uploader trong app.py")
+    source = source.replace(
+        UPLOADER_LINE, f"uploaded_file = __import__('io').BytesIO(open({image_path!r}, 'rb').read())")
+    patched = os.path.join(os.path.dirname(os.path.abspath(app_path)), "_bench_rerun_app.py")
+    with open(patched, "w", encoding="utf-8") as f:
+        f.write(source)
+    return patched
+
+
+def _timed_run(at):
+    t0 = time.perf_counter()
+    at.run()
+    if at.exception:
+        raise RuntimeError(str(at.exception))
+    return time.perf_counter() - t0
+
+
+def _widget(widgets, label):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise RuntimeError(f"Không tìm thấy widget: {label}")
+
+
+def _switch_tab(at, label):
+    # Chỉ có tác dụng khi tabs theo dõi trạng thái (on_change="rerun", có key)
+    if "main_tab" in at.session_state:
+        at.session_state["main_tab"] = label
+        at.run()
+
+
+def measure(app_path, image_path, repeat=5):
+    from streamlit.testing.v1 import AppTest
+
+    patched = _patched_app(app_path, image_path)
+    try:
+        at = AppTest.from_file(patched, default_timeout=600)
+        results = {"first_render": [_timed_run(at)]}
+
+        # Tab 1: chọn Gamma rồi kéo slider gamma
+        _widget(at.selectbox, "Chọn phương pháp cường độ sáng").select("Gamma/Power-law")
+        at.run()
+        results["gamma"] = []
+        for i in range(repeat):
+            _widget(at.slider, "Tham số γ (gamma)").set_value(round(0.5 + 0.1 * (i % 10), 1))
+            results["gamma"].append(_timed_run(at))
+
+        # Tab 2: CLAHE, kéo slider clip limit
+        _switch_tab(at, "Cân bằng histogram")
+        _widget(at.selectbox, "Chọn phương pháp cân bằng").select("CLAHE")
+        at.run()
+        results["clahe"] = []
+        for i in range(repeat):
+            _widget(at.slider, "Clip Limit").set_value(round(1.5 + 0.1 * (i % 10), 1))
+            results["clahe"].append(_timed_run(at))
+
+        # Tab 3: đổi qua lại giữa hai ứng dụng
+        _switch_tab(at, "Ứng dụng thực tế")
+        results["application"] = []
+        for i in range(repeat):
+            choice = "Cải thiện ảnh vệ tinh" if i % 2 == 0 else "Xử lý biển số xe"
+            _widget(at.selectbox, "Chọn ứng dụng thực tế").select(choice)
+            results["application"].append(_timed_run(at))
+        return results
+    finally:
+        os.remove(patched)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Độ trễ rerun của app khi thay đổi widget")
+    parser.add_argument("--app", default=os.path.join(ROOT, "app.py"))
+    parser.add_argument("--image", default=os.path.join(ROOT, "img", "thieusang.jpg"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    # Bỏ cảnh báo của Streamlit khi chạy bằng AppTest
+    logging.disable(logging.WARNING)
+
+    results = measure(args.app, os.path.abspath(args.image), args.repeat)
+    print(f"app: {args.app}")
+    print(f"{'kịch bản':<14} {'median ms':>10} {'min ms':>8}")
+    for name, times in results.items():
+        print(f"{name:<14} {1000 * np.median(times):>10.1f} {1000 * min(times):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+So sánh truyền ảnh vào/ra worker bằng pickle và bằng shared memory.
+
+Với mỗi pipeline enhance_* đo:
+- transfer: chỉ truyền ảnh qua lại (pipeline "negative" - gần như không tính toán)
+- total: thời gian một job đầy đủ
+
+Chạy:
+    python -m benchmarks.bench_shm --megapixels 8 --repeat 3
+
+low_light (ahe/clahe trên ảnh lớn, chậm) không nằm trong mặc định; đo riêng ở kích thước nhỏ:
+    python -m benchmarks.bench_shm --pipelines low_light --megapixels 1 --repeat 1
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from processing import planner
+from service.job_server import _run_job, _run_job_shm
+from service.shm import SharedImage, ensure_tracker
+
+PIPELINES = ["license_plate", "satellite"]
+
+
+def _time_pickle(pool, pipeline, img, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        pool.submit(_run_job, "bench", pipeline, {}, img).result()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def _time_shm(pool, pipeline, img, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        # Tính cả chi phí copy ảnh vào shared memory như job server thực tế
+        with SharedImage.from_array(img) as shared:
+            handle = pool.submit(_run_job_shm, "bench", pipeline, {}, shared.handle).result()
+            with SharedImage.adopt(handle) as result:
+                result.array.sum(dtype=np.uint64)  # chạm vào kết quả
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=8.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--pipelines", nargs="+", default=PIPELINES)
+    args = parser.parse_args(argv)
+    # Calibration backend + cost model planner (nếu máy chưa có cache) trước khi bắt đầu đo / nhận job
+    planner.warm_up()
+
+    side = int(np.sqrt(args.megapixels * 1e6))
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (side, side, 3), dtype=np.uint8)
+    print(f"Ảnh thử: {side}x{side}x3 ({img.nbytes / 1e6:.0f} MB)")
+
+    ensure_tracker()
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        pool.submit(_run_job, "warmup", "negative", {}, img[:8, :8]).result()
+        print(f"{'pipeline':<16}{'pickle (s)':>12}{'shm (s)':>12}{'speedup':>10}")
+        for pipeline in ["negative"] + list(args.pipelines):
+            t_pickle = _time_pickle(pool, pipeline, img, args.repeat)
+            t_shm = _time_shm(pool, pipeline, img, args.repeat)
+            label = "transfer" if pipeline == "negative" else pipeline
+            print(f"{label:<16}{t_pickle:>12.3f}{t_shm:>12.3f}{t_pickle / t_shm:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Đo thời gian khởi động của app (cold start).
+
+- import: chạy `python -X importtime` cho các module mà app.py import ở đầu file,
+  in ra các module tốn thời gian nhất và kiểm tra không module nặng nào
+  (cv2, matplotlib, scipy, pandas) bị nạp trước khi có ảnh được upload.
+- first render: thời gian từ lúc chạy script tới khi trang upload render xong
+  (dùng `streamlit.testing.v1.AppTest`, mỗi lần đo là một tiến trình mới).
+
+Chạy:
+    python -m benchmarks.bench_startup --repeat 5 --check
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Mục tiêu cho trang upload (giây, trên container triển khai)
+TARGET_FIRST_RENDER_S = 1.5
+HEAVY_MODULES = ("cv2", "matplotlib", "scipy", "pandas")
+
+
+
+def app_imports(path=None):
+    """Khối import ở đầu app.py (các lệnh import trước lệnh đầu tiên không phải import)"""
+    with open(path or os.path.join(ROOT, "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    lines = []
+    for node in tree.body:
+        if not isinstance(node, (ast.Import, ast.ImportFrom)):
+            break
+        lines.append(ast.unparse(node))
+    return "\n".join(lines)
+
+
+_FIRST_RENDER_SNIPPET = """
+import sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=60).run()
+elapsed = time.perf_counter() - t0
+if at.exception:
+    raise SystemExit(str(at.exception))
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+
+def _run(args):
+    # Calibration nền của app (start_warm_up) nạp cv2/scipy sau trang đầu - không tính vào đây
+    env = dict(os.environ, TIEU_LUAN_WARM_UP="0")
+    return subprocess.run([sys.executable] + args, cwd=ROOT, capture_output=True, text=True, env=env)
+
+
+def import_profile(top=10):
+    """Trả về (tổng thời gian import - giây, danh sách (module, cumulative µs), module nặng đã nạp)"""
+    code = app_imports() + f"\nimport sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    proc = _run(["-X", "importtime", "-c", code])
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.rstrip(), int(cumulative_us)))
+    # Chỉ cộng các module cấp cao nhất (tên không bị thụt lề)
+    total = sum(us for name, us in rows if not name.startswith("  ")) / 1e6
+    rows.sort(key=lambda r: r[1], reverse=True)
+    heavy = [m for m in proc.stdout.strip().split(",") if m]
+    return total, rows[:top], heavy
+
+
+def first_render(repeat=3):
+    """Trả về danh sách thời gian render trang upload (giây) và module nặng đã nạp"""
+    times, heavy = [], []
+    for _ in range(repeat):
+        proc = _run(["-c", _FIRST_RENDER_SNIPPET.format(heavy=HEAVY_MODULES)])
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr or proc.stdout)
+        elapsed, _, loaded = proc.stdout.strip().splitlines()[-1].partition(" ")
+        times.append(float(elapsed))
+        heavy = [m for m in loaded.split(",") if m]
+    return times, heavy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark thời gian khởi động app")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--check", action="store_true",
+                        help="trả về mã lỗi nếu vượt mục tiêu hoặc nạp module nặng")
+    args = parser.parse_args(argv)
+
+    total, rows, heavy_imports = import_profile(args.top)
+    print(f"Import các module đầu app.py: {total:.3f}s")
+    for name, us in rows:
+        print(f"  {us / 1000:8.1f} ms  {name.strip()}")
+
+    times, heavy_render = first_render(args.repeat)
+    best = min(times)
+    print(f"First render trang upload: best {best:.3f}s / median {sorted(times)[len(times) // 2]:.3f}s "
+          f"(mục tiêu {TARGET_FIRST_RENDER_S:.1f}s)")
+
+    heavy = sorted(set(heavy_imports) | set(heavy_render))
+    if heavy:
+        print(f"Module nặng bị nạp khi khởi động: {', '.join(heavy)}")
+
+    if args.check and (heavy or best > TARGET_FIRST_RENDER_S):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
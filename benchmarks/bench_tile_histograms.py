@@ -0,0 +1,87 @@
+"""
+Khả năng mở rộng theo số thread của kernel histogram theo ô (processing.histogram.tile_histograms).
+
+Ảnh được chia thành các dải hàng xử lý song song; đo với 1/2/4/8/16 thread cho:
+
+- he:        một ô (histogram toàn ảnh, như hist_equalization)
+- clahe:     lưới 8x8 (như clahe_equalization mặc định)
+- fine:      lưới ô nhỏ step x step (như các dải của ahe_equalization_fast)
+- clahe_e2e: toàn bộ clahe_equalization (histogram + tra bảng)
+
+Kết quả mọi số thread được kiểm tra giống hệt kết quả 1 thread. Speedup bị giới hạn
+bởi số core (os.cpu_count()) và băng thông bộ nhớ của máy.
+
+Chạy:
+    python -m benchmarks.bench_tile_histograms --megapixels 50 --threads 1 2 4 8 16
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from processing import backends
+from processing.histogram import clahe_equalization, tile_histograms
+
+
+def make_image(megapixels, seed=0):
+    """Ảnh xám tổng hợp ~megapixels MP (tỉ lệ 4:3): gradient + nhiễu"""
+    h = int(np.sqrt(megapixels * 1e6 * 3 / 4))
+    w = int(megapixels * 1e6 / h)
+    rng = np.random.default_rng(seed)
+    base = np.linspace(30, 220, w, dtype=np.float32)[None, :]
+    noise = rng.normal(0, 25, (h, w)).astype(np.float32)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def _grid(n, cells):
+    return np.linspace(0, n, cells + 1).astype(int)
+
+
+def _best(func, repeat):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scaling theo số thread của tile_histograms")
+    parser.add_argument("--megapixels", type=float, default=50)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--step", type=int, default=12, help="cạnh ô của kịch bản fine")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    # Calibration backend (nếu máy chưa có cache) trước khi bắt đầu đo / nhận job
+    backends.warm_up()
+
+    img = make_image(args.megapixels)
+    h, w = img.shape
+    # Lưới mịn: giới hạn số hàng ô để kết quả (R x C x 256) vừa bộ nhớ
+    fine_rows = np.arange(0, min(h, 256 * args.step) + 1, args.step)
+    cases = {
+        # tên: (số pixel được đọc, hàm theo số thread)
+        "he": (img.size, lambda n: tile_histograms(img, (0, h), (0, w), n)),
+        "clahe": (img.size, lambda n: tile_histograms(img, _grid(h, 8), _grid(w, 8), n)),
+        "fine": (fine_rows[-1] * w, lambda n: tile_histograms(img, fine_rows, np.arange(0, w + 1, args.step), n)),
+        "clahe_e2e": (img.size, lambda n: clahe_equalization(img, 2.0, 8, max_workers=n)),
+    }
+    print(f"ảnh {w}x{h} ({img.size / 1e6:.1f} MP), os.cpu_count() = {os.cpu_count()}")
+    print(f"| {'kịch bản':<10} | {'thread':>6} | {'ms':>8} | {'GB/s':>6} | {'speedup':>7} |")
+    print(f"|{'-' * 12}|{'-' * 8}|{'-' * 10}|{'-' * 8}|{'-' * 9}|")
+    for name, (pixels, run) in cases.items():
+        base_time, expected = None, None
+        for n in args.threads:
+            elapsed, out = _best(lambda: run(n), args.repeat)
+            if expected is None:
+                base_time, expected = elapsed, out
+            elif not np.array_equal(out, expected):
+                raise AssertionError(f"{name}: kết quả {n} thread khác kết quả {args.threads[0]} thread")
+            print(f"| {name:<10} | {n:>6} | {1000 * elapsed:>8.1f} | {pixels / elapsed / 1e9:>6.2f} | "
+                  f"{base_time / elapsed:>6.2f}x |")
+
+
+if __name__ == "__main__":
+    main()
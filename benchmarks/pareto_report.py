@@ -0,0 +1,219 @@
+"""
+Báo cáo tốc độ / chất lượng (Pareto) cho các thuật toán xấp xỉ.
+
+Mỗi nhóm so sánh biến thể xấp xỉ với phiên bản chính xác tương ứng trên bộ ảnh `img/`:
+
+- ahe_grid:          ahe_equalization_fast (grid, bỏ qua resize) vs ahe_equalization -> PSNR/MSE
+- ahe_lanczos:       ahe_equalization_fast thu nhỏ LANCZOS tới max_pixels vs độ phân giải gốc -> PSNR/MSE
+- threshold_lanczos: adaptive_threshold_custom thu nhỏ vs độ phân giải gốc -> tỉ lệ pixel trùng
+- histogram_stride:  histogram lấy mẫu cách `step` pixel (như plot_histogram) vs toàn bộ ảnh
+                     -> khoảng cách total variation (càng nhỏ càng tốt)
+
+Biến thể nằm trên đường Pareto (không có biến thể nào vừa nhanh hơn vừa chính xác hơn)
+được đánh dấu *. "Nhanh hơn" so theo speedup - tỉ lệ với thời gian của phiên bản chính
+xác trên đúng tập ảnh mà biến thể áp dụng (`applies`); time_ms là trung bình trên tập
+ảnh của từng dòng nên không so trực tiếp được giữa các dòng có n khác nhau.
+
+Chạy:
+    python -m benchmarks.pareto_report --csv pareto.csv
+    python -m benchmarks.pareto_report --families threshold_lanczos histogram_stride
+"""
+import argparse
+import csv
+import glob
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from processing import backends
+from processing.applications import adaptive_threshold_custom
+from processing.histogram import ahe_equalization, ahe_equalization_fast
+from utils.metrics import (compute_histogram_distance, compute_mse, compute_pixel_agreement,
+                           compute_psnr)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PSNR_CAP = 100.0  # PSNR vô cực (ảnh giống hệt) được tính là 100 dB khi lấy trung bình
+
+
+def load_corpus(directory, max_pixels=None):
+    """Ảnh xám uint8 từ thư mục, thu nhỏ (LANCZOS) nếu vượt max_pixels"""
+    images = []
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        if not path.lower().endswith((".jpg", ".jpeg", ".png")):
+            continue
+        image = Image.open(path).convert("L")
+        w, h = image.size
+        if max_pixels and w * h > max_pixels:
+            scale = np.sqrt(max_pixels / (w * h))
+            image = image.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
+        images.append((os.path.basename(path), np.array(image)))
+    return images
+
+
+def _timed(func):
+    t0 = time.perf_counter()
+    out = func()
+    return out, time.perf_counter() - t0
+
+
+def _psnr_capped(a, b):
+    return min(compute_psnr(a, b), PSNR_CAP)
+
+
+def _family(name, images, reference, variants, metric, metric_name, exact_value,
+            higher_is_better=True, applies=lambda img, params: True):
+    """
+    Chạy `reference(img)` và từng `variant(img, **params)` trên mọi ảnh, trả về các dòng kết quả.
+    `metric(ref_out, out)` trả về (giá trị chất lượng, MSE hoặc None);
+    `exact_value` là giá trị metric của chính phiên bản chính xác.
+    """
+    refs, ref_times = [], []
+    for _, img in images:
+        out, t = _timed(lambda: reference(img))
+        refs.append(out)
+        ref_times.append(t)
+    rows = [{
+        "family": name, "variant": "exact", "params": "", "n_images": len(images),
+        "time_ms": 1000 * float(np.mean(ref_times)), "speedup": 1.0,
+        "metric": metric_name, "value": exact_value,
+        "mse": 0.0 if metric_name == "psnr_db" else None,
+    }]
+    for label, func, params in variants:
+        values, mses, times, matched_ref_times = [], [], [], []
+        for (_, img), ref_out, ref_t in zip(images, refs, ref_times):
+            if not applies(img, params):
+                continue
+            out, t = _timed(lambda: func(img, **params))
+            value, mse = metric(ref_out, out)
+            values.append(value)
+            mses.append(mse)
+            times.append(t)
+            matched_ref_times.append(ref_t)
+        if not values:
+            continue
+        rows.append({
+            "family": name, "variant": label,
+            "params": " ".join(f"{k}={v}" for k, v in params.items()),
+            "n_images": len(values),
+            "time_ms": 1000 * float(np.mean(times)),
+            # So với phiên bản chính xác trên cùng tập ảnh
+            "speedup": sum(matched_ref_times) / max(sum(times), 1e-9),
+            "metric": metric_name, "value": float(np.mean(values)),
+            "mse": None if mses[0] is None else float(np.mean(mses)),
+        })
+    _mark_pareto(rows, higher_is_better)
+    return rows
+
+
+def _mark_pareto(rows, higher_is_better):
+    # Tốc độ so bằng speedup (cùng tập ảnh với phiên bản chính xác), không bằng time_ms
+    sign = 1 if higher_is_better else -1
+    for row in rows:
+        q, v = sign * row["value"], row["speedup"]
+        row["pareto"] = not any(
+            (sign * o["value"] >= q and o["speedup"] >= v) and (sign * o["value"] > q or o["speedup"] > v)
+            for o in rows if o is not row)
+
+
+# --- Các nhóm so sánh ---
+
+def _image_metric(ref, out):
+    return _psnr_capped(ref, out), compute_mse(ref, out)
+
+
+def family_ahe_grid(corpus_dir, max_pixels):
+    images = load_corpus(corpus_dir, max_pixels)
+    window = 64
+    variants = [(f"grid step={s}", ahe_equalization_fast,
+                 {"window_size": window, "step_size": s, "max_pixels": None}) for s in (4, 8, 12, 16)]
+    return _family("ahe_grid", images, lambda img: ahe_equalization(img, window),
+                   variants, _image_metric, "psnr_db", PSNR_CAP)
+
+
+def family_ahe_lanczos(corpus_dir, max_pixels):
+    images = load_corpus(corpus_dir, max_pixels)
+    base = {"window_size": 64, "step_size": 8}
+    variants = [(f"lanczos {t // 1000}K", ahe_equalization_fast, dict(base, max_pixels=t))
+                for t in (500000, 250000, 125000, 62500)]
+    return _family("ahe_lanczos", images,
+                   lambda img: ahe_equalization_fast(img, max_pixels=None, **base),
+                   variants, _image_metric, "psnr_db", PSNR_CAP,
+                   applies=lambda img, p: img.size > p["max_pixels"])
+
+
+def family_threshold_lanczos(corpus_dir, max_pixels):
+    images = load_corpus(corpus_dir, max_pixels)
+    variants = [(f"lanczos {t // 1000}K", adaptive_threshold_custom, {"max_pixels": t})
+                for t in (1000000, 500000, 250000, 125000, 62500)]
+    return _family("threshold_lanczos", images,
+                   lambda img: adaptive_threshold_custom(img, max_pixels=None),
+                   variants, lambda ref, out: (compute_pixel_agreement(ref, out), None),
+                   "pixel_agreement", 1.0, applies=lambda img, p: img.size > p["max_pixels"])
+
+
+def _strided_histogram(img, step=1):
+    # Giống plot_histogram: 128 bin, lấy mẫu img[::step, ::step]
+    return np.histogram(img[::step, ::step].ravel(), bins=128, range=(0, 256))[0]
+
+
+def family_histogram_stride(corpus_dir, max_pixels):
+    images = load_corpus(corpus_dir, max_pixels)
+    variants = [(f"stride {s}", _strided_histogram, {"step": s}) for s in (2, 3, 4, 6, 8)]
+    return _family("histogram_stride", images, _strided_histogram, variants,
+                   lambda ref, out: (compute_histogram_distance(ref, out), None),
+                   "tv_distance", 0.0, higher_is_better=False)
+
+
+FAMILIES = {
+    # tên: (hàm, max_pixels mặc định của ảnh đầu vào)
+    "ahe_grid": (family_ahe_grid, 65536),  # AHE chính xác rất chậm -> ảnh nhỏ
+    "ahe_lanczos": (family_ahe_lanczos, 1000000),
+    "threshold_lanczos": (family_threshold_lanczos, None),
+    "histogram_stride": (family_histogram_stride, None),
+}
+
+
+def format_table(rows):
+    pw = max([len("params")] + [len(r["params"]) for r in rows])
+    header = f"| {'variant':<16} | {'params':<{pw}} | {'n':>3} | {'time ms':>9} | {'speedup':>8} | {'metric':<16} | {'value':>8} | {'mse':>8} | P |"
+    lines = [header, "|" + "|".join("-" * (len(c)) for c in header.split("|")[1:-1]) + "|"]
+    for r in rows:
+        mse = "" if r["mse"] is None else f"{r['mse']:.2f}"
+        lines.append(
+            f"| {r['variant']:<16} | {r['params']:<{pw}} | {r['n_images']:>3} | {r['time_ms']:>9.2f} | "
+            f"{r['speedup']:>7.2f}x | {r['metric']:<16} | {r['value']:>8.4f} | {mse:>8} | "
+            f"{'*' if r['pareto'] else ' '} |")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Báo cáo Pareto tốc độ / chất lượng")
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "img"))
+    parser.add_argument("--families", nargs="+", choices=list(FAMILIES), default=list(FAMILIES))
+    parser.add_argument("--max-pixels", type=int, default=None,
+                        help="ghi đè giới hạn kích thước ảnh đầu vào cho mọi nhóm")
+    parser.add_argument("--csv", default=None, help="ghi toàn bộ kết quả ra file CSV")
+    args = parser.parse_args(argv)
+    # Calibration backend (nếu máy chưa có cache) trước khi bắt đầu đo / nhận job
+    backends.warm_up()
+
+    all_rows = []
+    for name in args.families:
+        func, default_max = FAMILIES[name]
+        rows = func(args.corpus, args.max_pixels or default_max)
+        print(f"\n## {name}\n")
+        print(format_table(rows))
+        all_rows += rows
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(all_rows[0]))
+            writer.writeheader()
+            writer.writerows(all_rows)
+        print(f"\nĐã ghi {len(all_rows)} dòng vào {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
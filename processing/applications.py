@@ -1,52 +1,60 @@
-import cv2
 import numpy as np
+from . import backends
+from .roi import roi_aware
 from .intensity import negative, log_transform, gamma_correction, piecewise_linear
-from .histogram import hist_equalization, clahe_equalization, ahe_equalization_fast
+from .histogram import clahe_equalization
+from .planner import plan_threshold, run_plan
 
-def adaptive_threshold_custom(img, max_value=255, block_size=21, C=8):
+# Ngân sách thời gian mặc định cho bước adaptive threshold của enhance_license_plate
+LICENSE_PLATE_BUDGET_S = 1.0
+
+def adaptive_threshold_custom(img, max_value=255, block_size=21, C=8, max_pixels=2000000):
     """
     Adaptive thresholding tối ưu hóa với vectorization
     Time Complexity: O(H×W) với vectorized operations
+
+    Args:
+        max_pixels: Ảnh lớn hơn ngưỡng này được thu nhỏ trước khi xử lý
+            (None để luôn xử lý ở độ phân giải gốc)
     """
     h, w = img.shape
     
     # Giới hạn kích thước để tránh quá chậm
-    if h * w > 2000000:  # > 2M pixels
+    if max_pixels and h * w > max_pixels:
         # Resize ảnh xuống kích thước hợp lý
         from PIL import Image
-        scale = np.sqrt(2000000 / (h * w))
+        from utils.pyramid import pyramid_for
+        scale = np.sqrt(max_pixels / (h * w))
         new_h, new_w = int(h * scale), int(w * scale)
-        img_small = np.array(Image.fromarray(img).resize((new_w, new_h), Image.LANCZOS))
+        # Resize từ mức pyramid gần nhất thay vì từ ảnh gốc
+        source = pyramid_for(img).level_for_pixels(max_pixels, above=True)
+        img_small = np.array(Image.fromarray(source).resize((new_w, new_h), Image.LANCZOS))
         
         # Xử lý ảnh nhỏ
         binary_small = adaptive_threshold_custom(img_small, max_value, 
-                                               max(11, block_size // 2), C)
+                                               max(11, block_size // 2), C,
+                                               max_pixels=None)
         
         # Resize lại về kích thước gốc
         binary = np.array(Image.fromarray(binary_small).resize((w, h), Image.NEAREST))
         return binary.astype(np.uint8)
     
-    # Sử dụng cv2.boxFilter cho convolution nhanh
-    try:
-        import cv2
-        # Box filter để tính mean local nhanh
-        kernel = np.ones((block_size, block_size), np.float32) / (block_size * block_size)
-        mean_img = cv2.filter2D(img.astype(np.float32), -1, kernel)
-        
-        # Vectorized thresholding
-        binary = np.where(img > mean_img - C, max_value, 0).astype(np.uint8)
-        
-    except ImportError:
-        # Fallback với scipy convolution nếu không có cv2
-        from scipy.ndimage import uniform_filter
-        mean_img = uniform_filter(img.astype(np.float32), size=block_size, mode='constant')
-        binary = np.where(img > mean_img - C, max_value, 0).astype(np.uint8)
+    # Box filter để tính mean local nhanh (backend OpenCV/SciPy/NumPy chọn theo calibration)
+    mean_img = backends.box_filter(img.astype(np.float32), block_size)
+    
+    # Vectorized thresholding
+    binary = np.where(img > mean_img - C, max_value, 0).astype(np.uint8)
     
     return binary
 
-def enhance_license_plate(img):
+@roi_aware(margin=11, min_size=8)
+def enhance_license_plate(img, budget_s=LICENSE_PLATE_BUDGET_S):
     """
     Tiền xử lý ảnh cho nhận dạng biển số xe
+
+    Truyền `rois=[(x, y, w, h), ...]` để chỉ xử lý vùng biển số (xem `processing.roi`).
+    Độ phân giải của bước adaptive threshold do planner chọn theo `budget_s` (giây)
+    thay cho ngưỡng 2M điểm ảnh cố định (xem `processing.planner`).
     """
     try:
         # Chuyển sang ảnh xám nếu là ảnh màu
@@ -68,8 +76,9 @@ def enhance_license_plate(img):
         p95 = np.percentile(enhanced, 95)
         enhanced = piecewise_linear(enhanced, int(p5), 20, int(p95), 235)
         
-        # Bước 4: Adaptive thresholding tự implement
-        result = adaptive_threshold_custom(enhanced, 255, 21, 8)
+        # Bước 4: Adaptive thresholding tự implement, độ phân giải theo ngân sách
+        plan = plan_threshold(enhanced.shape, budget_s)
+        result, _ = run_plan(enhanced, plan, max_value=255, block_size=21, C=8)
         
         return result
     
@@ -84,6 +93,7 @@ def enhance_license_plate(img):
         enhanced_fallback = clahe_equalization(gray_fallback, clip=2.0, grid=8)
         return adaptive_threshold_custom(enhanced_fallback, 255, 15, 5)
 
+@roi_aware(margin=0, min_size=12)
 def enhance_satellite_image(img):
     """
     Cải thiện ảnh vệ tinh trong GIS
@@ -134,6 +144,7 @@ def enhance_satellite_image(img):
     
     return enhanced
 
+@roi_aware(margin=1, min_size=8)
 def enhance_low_light_image(img, method="enhanced"):
     """
     Nâng cao chất lượng ảnh chụp trong điều kiện ánh sáng kém
@@ -195,3 +206,70 @@ def enhance_low_light_image(img, method="enhanced"):
     return enhanced
 
 
+
+def estimate_background(gray, cell_size=64, percentile=90, sample_step=4):
+    """
+    Ước lượng nền (giấy) của ảnh tài liệu bằng lấy mẫu thưa: O(H×W)
+
+    - Lấy mẫu mỗi `sample_step` pixel theo mỗi chiều
+    - Chia thành các ô cell_size x cell_size, histogram 256 bin cho mỗi ô (một lần bincount)
+    - Giá trị nền của ô = percentile của histogram (chữ tối nằm dưới percentile)
+    - Nội suy tuyến tính lưới nền về kích thước ảnh gốc
+
+    Returns:
+        Ảnh nền uint8 cùng kích thước với `gray`
+    """
+    h, w = gray.shape
+    step = max(1, min(sample_step, cell_size // 4))
+    samples = gray[::step, ::step]
+    cells = max(1, cell_size // step)  # số mẫu mỗi cạnh ô
+    sh, sw = samples.shape
+    ny, nx = -(-sh // cells), -(-sw // cells)
+
+    # Khóa (ô, mức xám) cho mọi mẫu -> histogram của tất cả các ô bằng một lần bincount
+    cell_y = (np.arange(sh) // cells).astype(np.int32)
+    cell_x = (np.arange(sw) // cells).astype(np.int32)
+    keys = (cell_y[:, None] * nx + cell_x[None, :]) * 256 + samples
+    hist = np.bincount(keys.ravel(), minlength=ny * nx * 256).reshape(ny * nx, 256)
+
+    # Percentile từ histogram tích lũy
+    cdf = np.cumsum(hist, axis=1)
+    target = cdf[:, -1:] * (percentile / 100.0)
+    grid = np.argmax(cdf >= target, axis=1).astype(np.uint8).reshape(ny, nx)
+
+    return backends.resize(grid, (w, h), "linear")
+
+def _document_lut(gamma, binarize, threshold):
+    """
+    Bảng tra 2 chiều lut[nền, pixel]: chia cho nền -> gamma -> (tùy chọn) ngưỡng.
+    Gộp toàn bộ phép tính trên từng pixel thành một lần tra bảng.
+    """
+    bg = np.maximum(np.arange(256, dtype=np.float32), 1)[:, None]
+    ratio = np.clip(np.arange(256, dtype=np.float32)[None, :] / bg, 0, 1)
+    if binarize:
+        return np.where(ratio >= threshold, 255, 0).astype(np.uint8)
+    return np.clip(np.power(ratio, gamma) * 255 + 0.5, 0, 255).astype(np.uint8)
+
+@roi_aware(margin=0)
+def enhance_document(img, cell_size=64, percentile=90, gamma=1.5, binarize=False,
+                     threshold=0.8, invert=False):
+    """
+    Khôi phục ảnh tài liệu scan/chụp (giấy ố vàng, bóng đổ, chữ mờ)
+
+    Bước 1: Chuyển xám (và negative nếu `invert` - bản âm bản, chữ sáng trên nền tối)
+    Bước 2: Ước lượng nền bằng lấy mẫu thưa + nội suy (estimate_background)
+    Bước 3: Chia cho nền -> nền về trắng đều
+    Bước 4: Gamma (> 1 làm đậm chữ) hoặc ngưỡng theo tỉ lệ với nền (`binarize`)
+    Time Complexity: O(H×W), bước 3-4 là một lần tra bảng trên mỗi pixel
+    """
+    gray = backends.rgb_to_gray(img) if img.ndim == 3 else img
+    if invert:
+        gray = negative(gray)
+
+    background = estimate_background(gray, cell_size, percentile)
+
+    # Chỉ số (nền << 8) | pixel vào bảng tra 256 x 256
+    index = background.astype(np.uint16)
+    index <<= 8
+    index |= gray
+    return _document_lut(gamma, binarize, threshold).ravel()[index]
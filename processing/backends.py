@@ -0,0 +1,317 @@
+"""
+Registry các backend tính toán (NumPy / OpenCV / SciPy) cho các primitive dùng chung:
+
+- histogram(img)                 -> 256 bin cho ảnh uint8
+- box_filter(img, size)          -> trung bình cửa sổ size x size (biên reflect-101)
+- lut_apply(img, lut)            -> tra bảng 256 mức
+- resize(img, (w, h), interp)    -> interp: "nearest" | "linear"
+- rgb_to_gray(img)               -> ảnh xám uint8 (0.299R + 0.587G + 0.114B)
+
+Backend nhanh nhất cho từng primitive và từng nhóm kích thước được chọn bằng
+microbenchmark trên máy hiện tại (lưu cache trên đĩa). Có thể ép backend để test:
+
+    with force_backend("numpy"):
+        ...
+hoặc đặt biến môi trường TIEU_LUAN_BACKEND=numpy.
+"""
+import importlib.util
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from utils.disk_cache import host_signature, load_json, save_json
+
+PRIMITIVES = ("histogram", "box_filter", "lut_apply", "resize", "rgb_to_gray")
+# Thứ tự ưu tiên khi chưa calibrate
+DEFAULT_ORDER = ("opencv", "scipy", "numpy")
+# Nhóm kích thước theo số điểm ảnh: (tên, giới hạn trên)
+SIZE_CLASSES = (("small", 256 * 1024), ("medium", 4 * 1024 * 1024), ("large", None))
+
+_CACHE_FILE = "backend_calibration.json"
+_MODULES = {"numpy": "numpy", "opencv": "cv2", "scipy": "scipy"}
+
+_registry = {name: {} for name in PRIMITIVES}
+_selection = None
+# Chỉ một thread đo/đọc cache (các thread dải của tile_histograms, nhiều session Streamlit)
+_selection_lock = threading.Lock()
+_forced = threading.local()
+
+
+def register(primitive, backend):
+    """Decorator đăng ký một cài đặt của `primitive` cho `backend`"""
+    def decorator(func):
+        _registry[primitive][backend] = func
+        return func
+    return decorator
+
+
+def backend_available(backend):
+    return importlib.util.find_spec(_MODULES[backend]) is not None
+
+
+def available(primitive):
+    """Các backend dùng được cho primitive trên máy này"""
+    return [b for b in _registry[primitive] if backend_available(b)]
+
+
+def size_class(n_pixels):
+    for name, limit in SIZE_CLASSES:
+        if limit is None or n_pixels < limit:
+            return name
+
+
+@contextmanager
+def force_backend(backend, primitive=None):
+    """Ép dùng `backend` (cho mọi primitive hoặc chỉ một primitive) trong khối `with`"""
+    previous = dict(getattr(_forced, "value", {}))
+    forced = dict(previous)
+    for name in ([primitive] if primitive else PRIMITIVES):
+        if backend in _registry[name]:
+            forced[name] = backend
+    _forced.value = forced
+    try:
+        yield
+    finally:
+        _forced.value = previous
+
+
+def select(primitive, n_pixels):
+    """Tên backend sẽ được dùng cho primitive với ảnh `n_pixels` điểm ảnh"""
+    forced = getattr(_forced, "value", {}).get(primitive) or os.environ.get("TIEU_LUAN_BACKEND")
+    if forced and forced in _registry[primitive] and backend_available(forced):
+        return forced
+    selection = _get_selection()
+    choice = selection.get(primitive, {}).get(size_class(n_pixels))
+    if choice in _registry[primitive] and backend_available(choice):
+        return choice
+    for backend in DEFAULT_ORDER:
+        if backend in _registry[primitive] and backend_available(backend):
+            return backend
+    raise RuntimeError(f"Không có backend cho {primitive}")
+
+
+def _dispatch(primitive, img, *args, **kwargs):
+    return _registry[primitive][select(primitive, img.size)](img, *args, **kwargs)
+
+
+# --- API công khai ---
+
+def histogram(img):
+    return _dispatch("histogram", img)
+
+
+def box_filter(img, size):
+    return _dispatch("box_filter", img, size)
+
+
+def lut_apply(img, lut):
+    return _dispatch("lut_apply", img, lut)
+
+
+def resize(img, size, interpolation="linear"):
+    return _dispatch("resize", img, size, interpolation)
+
+
+def rgb_to_gray(img):
+    return _dispatch("rgb_to_gray", img)
+
+
+# --- NumPy ---
+
+@register("histogram", "numpy")
+def _histogram_numpy(img):
+    return np.bincount(img.ravel(), minlength=256)
+
+
+@register("box_filter", "numpy")
+def _box_filter_numpy(img, size):
+    # Integral image trên ảnh đã pad reflect-101 (np.pad mode="reflect")
+    r = size // 2
+    padded = np.pad(img.astype(np.float64), r, mode="reflect")
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), np.float64)
+    integral[1:, 1:] = padded.cumsum(0).cumsum(1)
+    h, w = img.shape
+    total = (integral[size:size + h, size:size + w] - integral[:h, size:size + w]
+             - integral[size:size + h, :w] + integral[:h, :w])
+    return (total / (size * size)).astype(np.float32)
+
+
+@register("lut_apply", "numpy")
+def _lut_apply_numpy(img, lut):
+    return np.asarray(lut)[img]
+
+
+def _resize_coords(src, dst):
+    # Tọa độ tâm pixel (giống cv2 INTER_LINEAR)
+    x = (np.arange(dst) + 0.5) * (src / dst) - 0.5
+    return np.clip(x, 0, src - 1)
+
+
+@register("resize", "numpy")
+def _resize_numpy(img, size, interpolation="linear"):
+    w, h = size
+    src_h, src_w = img.shape[:2]
+    if interpolation == "nearest":
+        ys = np.minimum((np.arange(h) * src_h / h).astype(np.intp), src_h - 1)
+        xs = np.minimum((np.arange(w) * src_w / w).astype(np.intp), src_w - 1)
+        return img[ys[:, None], xs]
+    y = _resize_coords(src_h, h)
+    x = _resize_coords(src_w, w)
+    y0, x0 = np.floor(y).astype(np.intp), np.floor(x).astype(np.intp)
+    y1, x1 = np.minimum(y0 + 1, src_h - 1), np.minimum(x0 + 1, src_w - 1)
+    wy, wx = (y - y0)[:, None], (x - x0)[None, :]
+    if img.ndim == 3:
+        wy, wx = wy[..., None], wx[..., None]
+    f = img.astype(np.float32)
+    top = f[y0][:, x0] * (1 - wx) + f[y0][:, x1] * wx
+    bottom = f[y1][:, x0] * (1 - wx) + f[y1][:, x1] * wx
+    out = top * (1 - wy) + bottom * wy
+    if img.dtype == np.uint8:
+        return np.clip(np.rint(out), 0, 255).astype(np.uint8)
+    return out.astype(img.dtype)
+
+
+@register("rgb_to_gray", "numpy")
+def _rgb_to_gray_numpy(img):
+    return np.rint(np.dot(img[..., :3], [0.299, 0.587, 0.114])).astype(np.uint8)
+
+
+# --- OpenCV ---
+
+@register("histogram", "opencv")
+def _histogram_opencv(img):
+    import cv2
+    hist = cv2.calcHist([np.ascontiguousarray(img)], [0], None, [256], [0, 256])
+    return hist.ravel().astype(np.int64)
+
+
+@register("box_filter", "opencv")
+def _box_filter_opencv(img, size):
+    import cv2
+    return cv2.boxFilter(img.astype(np.float32), -1, (size, size),
+                         borderType=cv2.BORDER_REFLECT_101)
+
+
+@register("lut_apply", "opencv")
+def _lut_apply_opencv(img, lut):
+    import cv2
+    lut = np.asarray(lut)
+    if img.dtype != np.uint8 or lut.dtype != np.uint8:
+        return lut[img]
+    return cv2.LUT(img, lut)
+
+
+@register("resize", "opencv")
+def _resize_opencv(img, size, interpolation="linear"):
+    import cv2
+    flag = cv2.INTER_NEAREST if interpolation == "nearest" else cv2.INTER_LINEAR
+    return cv2.resize(img, tuple(size), interpolation=flag)
+
+
+@register("rgb_to_gray", "opencv")
+def _rgb_to_gray_opencv(img):
+    import cv2
+    return cv2.cvtColor(np.ascontiguousarray(img[..., :3]), cv2.COLOR_RGB2GRAY)
+
+
+# --- SciPy ---
+
+@register("histogram", "scipy")
+def _histogram_scipy(img):
+    from scipy import ndimage
+    return ndimage.histogram(img, 0, 255, 256).astype(np.int64)
+
+
+@register("box_filter", "scipy")
+def _box_filter_scipy(img, size):
+    from scipy import ndimage
+    return ndimage.uniform_filter(img.astype(np.float32), size=size, mode="mirror")
+
+
+@register("resize", "scipy")
+def _resize_scipy(img, size, interpolation="linear"):
+    from scipy import ndimage
+    if interpolation == "nearest":
+        # ndimage.zoom order=0 làm tròn tọa độ khác cv2 -> dùng cách chọn pixel của NumPy
+        return _resize_numpy(img, size, "nearest")
+    w, h = size
+    zoom = (h / img.shape[0], w / img.shape[1]) + ((1,) if img.ndim == 3 else ())
+    out = ndimage.zoom(img, zoom, order=1, grid_mode=True, mode="nearest")
+    return out[:h, :w]
+
+
+# --- Calibration ---
+
+def _bench_inputs(n_pixels):
+    side = int(np.sqrt(n_pixels))
+    rng = np.random.default_rng(0)
+    gray = rng.integers(0, 256, (side, side), dtype=np.uint8)
+    rgb = rng.integers(0, 256, (side, side, 3), dtype=np.uint8)
+    lut = (255 - np.arange(256)).astype(np.uint8)
+    return {
+        "histogram": (gray,),
+        "box_filter": (gray.astype(np.float32), 21),
+        "lut_apply": (gray, lut),
+        "resize": (gray, (side // 2, side // 2), "linear"),
+        "rgb_to_gray": (rgb,),
+    }
+
+
+def calibrate(save=True, repeat=3):
+    """
+    Đo từng backend cho từng primitive ở mỗi nhóm kích thước, chọn backend nhanh nhất.
+    Kết quả: {primitive: {size_class: backend}}.
+    """
+    sizes = {"small": 128 * 128, "medium": 1024 * 1024, "large": 2048 * 2048}
+    selection, timings = {}, {}
+    for cls, n_pixels in sizes.items():
+        inputs = _bench_inputs(n_pixels)
+        for primitive in PRIMITIVES:
+            results = {}
+            for backend in available(primitive):
+                func = _registry[primitive][backend]
+                func(*inputs[primitive])  # warmup (import lazy, cache của thư viện)
+                best = float("inf")
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    func(*inputs[primitive])
+                    best = min(best, time.perf_counter() - t0)
+                results[backend] = best
+            if results:
+                selection.setdefault(primitive, {})[cls] = min(results, key=results.get)
+                timings.setdefault(primitive, {})[cls] = results
+    if save:
+        save_json(_CACHE_FILE, {"host": host_signature(), "selection": selection, "timings": timings})
+    return selection
+
+
+def _get_selection():
+    global _selection
+    if _selection is None:
+        with _selection_lock:
+            if _selection is None:
+                cached = load_json(_CACHE_FILE)
+                if cached and cached.get("host") == host_signature():
+                    _selection = cached["selection"]
+                else:
+                    _selection = calibrate()
+    return _selection
+
+
+def warm_up():
+    """
+    Đọc (hoặc đo lần đầu trên máy, vài giây) lựa chọn backend. Gọi khi khởi động app /
+    CLI để chi phí calibration không rơi vào request xử lý ảnh đầu tiên.
+    """
+    _get_selection()
+
+
+def recalibrate():
+    """Bỏ kết quả cũ và đo lại"""
+    global _selection
+    with _selection_lock:
+        _selection = calibrate()
+    return _selection
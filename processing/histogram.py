@@ -1,31 +1,214 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from PIL import Image
 
-def hist_equalization(img):
+from . import backends
+from .roi import roi_aware
+
+def _as_stack(img, batch=False):
+    """
+    Ảnh xám (H, W) -> stack (1, H, W); với batch=True `img` phải là stack (N, H, W).
+    Mảng 3 chiều chỉ được coi là stack khi batch=True (không nhầm với ảnh màu (H, W, 3)).
+    """
+    if batch:
+        if img.ndim != 3 or img.dtype != np.uint8:
+            raise ValueError("batch=True: đầu vào phải là stack ảnh xám (N, H, W) kiểu uint8")
+        return img
+    if img.ndim != 2 or img.dtype != np.uint8:
+        raise ValueError("Đầu vào phải là ảnh xám (grayscale) với kiểu dữ liệu uint8")
+    return img[None]
+
+# Ảnh trong stack có từ ngần này pixel trở lên: gọi backend cho từng ảnh
+# (chi phí mỗi lần gọi Python không còn đáng kể so với số pixel)
+STACK_LOOP_PIXELS = 65536
+# Ảnh nhỏ được gộp thành khối khoảng ngần này pixel để mảng chỉ số nằm gọn trong cache
+STACK_CHUNK_PIXELS = 1 << 17
+
+def _stack_chunks(stack):
+    """Chia stack (N, H, W) thành các khối ảnh liên tiếp: (chỉ số ảnh đầu, khối)"""
+    per_image = max(1, stack[0].size)
+    k = 1 if per_image >= STACK_LOOP_PIXELS else max(1, STACK_CHUNK_PIXELS // per_image)
+    for start in range(0, stack.shape[0], k):
+        yield start, stack[start:start + k]
+
+def _offset_keys(chunk):
+    # Chỉ số (ảnh thứ i trong khối) * 256 + mức xám
+    n = chunk.shape[0]
+    return chunk.reshape(n, -1) + (np.arange(n, dtype=np.intp) * 256)[:, None]
+
+def stack_histograms(stack):
+    """
+    Histogram 256 bin của từng ảnh trong stack (N, H, W). Ảnh nhỏ được gộp theo khối
+    và tính bằng một lần bincount với chỉ số dịch theo ảnh. Trả về mảng (N, 256).
+    """
+    hists = np.empty((stack.shape[0], 256), dtype=np.int64)
+    for start, chunk in _stack_chunks(stack):
+        n = chunk.shape[0]
+        if n == 1:
+            hists[start] = backends.histogram(chunk[0])
+        else:
+            hists[start:start + n] = np.bincount(_offset_keys(chunk).ravel(),
+                                                 minlength=n * 256).reshape(n, 256)
+    return hists
+
+def stack_lut_apply(stack, luts):
+    """Áp dụng LUT riêng `luts[i]` cho ảnh thứ i của stack (ảnh nhỏ: một lần gather mỗi khối)"""
+    luts = np.asarray(luts)
+    result = np.empty(stack.shape, dtype=luts.dtype)
+    for start, chunk in _stack_chunks(stack):
+        n = chunk.shape[0]
+        if n == 1:
+            result[start] = backends.lut_apply(chunk[0], luts[start])
+        else:
+            table = luts[start:start + n].reshape(-1)
+            result[start:start + n] = table[_offset_keys(chunk)].reshape(chunk.shape)
+    return result
+
+# Mỗi thread của tile_histograms nhận ít nhất ngần này pixel (ảnh nhỏ hơn: không chia dải)
+PARALLEL_BAND_PIXELS = 1 << 18
+# Số thread mặc định của tile_histograms
+HISTOGRAM_WORKERS = os.cpu_count() or 1
+# Phần ô trong một dải có từ ngần này pixel trở lên: gọi backend cho từng phần ô,
+# nhỏ hơn: một lần bincount theo chỉ số (ô, mức xám) - điểm hòa vốn đo trên ảnh 16MP
+TILE_LOOP_PIXELS = 1 << 13
+# Số ô tối đa mỗi nhóm dải của _row_band_histograms (16K ô x 256 bin x 8 byte = 32MB)
+TILE_CHUNK_CELLS = 1 << 14
+
+def _band_histograms(img, row_edges, col_edges, y0, y1):
+    """
+    Histogram từng phần của các ô mà dải hàng img[y0:y1] cắt qua.
+    Trả về (chỉ số hàng ô đầu tiên, mảng (số hàng ô, C, 256))
+    """
+    first = min(int(np.searchsorted(row_edges, y0, side="right")) - 1, len(row_edges) - 2)
+    last = int(np.searchsorted(row_edges, y1, side="left"))
+    n_cols = len(col_edges) - 1
+    x0, x1 = int(col_edges[0]), int(col_edges[-1])
+    hists = np.zeros((last - first, n_cols, 256), dtype=np.int64)
+    if (y1 - y0) * (x1 - x0) >= (last - first) * n_cols * TILE_LOOP_PIXELS:
+        # Ô lớn: gọi backend cho từng phần ô
+        for k in range(first, last):
+            r0, r1 = max(row_edges[k], y0), min(row_edges[k + 1], y1)
+            for j in range(n_cols):
+                if r1 > r0 and col_edges[j + 1] > col_edges[j]:
+                    hists[k - first, j] = backends.histogram(img[r0:r1, col_edges[j]:col_edges[j + 1]])
+        return first, hists
+    # Nhiều ô nhỏ: bincount với chỉ số (hàng ô, cột ô, mức xám), mỗi lần một khối hàng
+    col_keys = np.repeat(np.arange(n_cols, dtype=np.intp) << 8, np.diff(col_edges))
+    row_keys = np.repeat(np.arange(last - first, dtype=np.intp) * (n_cols << 8),
+                         np.diff(row_edges[first:last + 1]))
+    flat = hists.reshape(-1)
+    step = max(1, STACK_CHUNK_PIXELS // max(1, x1 - x0))
+    for r in range(y0, y1, step):
+        keys_r = row_keys[r - row_edges[first]:min(r + step, y1) - row_edges[first]]
+        offset = keys_r[0]
+        keys = (keys_r - offset)[:, None] + col_keys
+        keys |= img[r:r + len(keys_r), x0:x1]
+        counts = np.bincount(keys.ravel(), minlength=keys_r[-1] - offset + (n_cols << 8))
+        flat[offset:offset + len(counts)] += counts
+    return first, hists
+
+def tile_histograms(img, row_edges, col_edges, max_workers=None):
+    """
+    Histogram 256 bin của từng ô trong lưới chia ảnh xám `img` theo row_edges x col_edges:
+    ô (i, j) là img[row_edges[i]:row_edges[i+1], col_edges[j]:col_edges[j+1]].
+    Trả về mảng (R, C, 256).
+
+    Ảnh lớn được chia thành các dải hàng xử lý song song bằng thread pool (bincount và
+    calcHist nhả GIL): mỗi dải cho histogram từng phần của các ô nó cắt qua, cộng lại ở cuối.
+
+    Args:
+        max_workers: số thread (mặc định HISTOGRAM_WORKERS = số CPU)
+    """
+    row_edges = np.asarray(row_edges, dtype=np.intp)
+    col_edges = np.asarray(col_edges, dtype=np.intp)
+    result = np.zeros((len(row_edges) - 1, len(col_edges) - 1, 256), dtype=np.int64)
+    y0, y1 = int(row_edges[0]), int(row_edges[-1])
+    if y1 <= y0 or col_edges[-1] <= col_edges[0]:
+        return result
+    pixels = (y1 - y0) * int(col_edges[-1] - col_edges[0])
+    workers = HISTOGRAM_WORKERS if max_workers is None else max_workers
+    bands = max(1, min(workers, pixels // PARALLEL_BAND_PIXELS, y1 - y0))
+    cuts = np.linspace(y0, y1, bands + 1).astype(int)
+
+    def band(k):
+        return _band_histograms(img, row_edges, col_edges, cuts[k], cuts[k + 1])
+
+    if bands == 1:
+        parts = [band(0)]
+    else:
+        from utils.profiling import worker_thread_prefix
+        with ThreadPoolExecutor(max_workers=bands, thread_name_prefix=worker_thread_prefix()) as pool:
+            parts = list(pool.map(band, range(bands)))
+    for first, hists in parts:
+        result[first:first + len(hists)] += hists
+    return result
+
+def _row_band_histograms(img, row_edges, col_edges, max_workers=None):
+    """
+    Histogram (C, 256) của từng dải hàng img[row_edges[k]:row_edges[k+1]] chia theo
+    col_edges, lần lượt theo k. Tính theo nhóm dải bằng tile_histograms (đủ việc cho các
+    thread), số ô mỗi nhóm có giới hạn nên bộ nhớ không tăng theo kích thước ảnh.
+    """
+    row_edges = np.asarray(row_edges, dtype=np.intp)
+    n_cols = max(1, len(col_edges) - 1)
+    width = max(1, int(col_edges[-1] - col_edges[0]))
+    workers = HISTOGRAM_WORKERS if max_workers is None else max_workers
+    target_rows = max(1, workers * PARALLEL_BAND_PIXELS // width)
+    max_bands = max(1, TILE_CHUNK_CELLS // n_cols)
+    k, n = 0, len(row_edges) - 1
+    while k < n:
+        stop = int(np.searchsorted(row_edges, row_edges[k] + target_rows, side="right")) - 1
+        stop = min(max(stop, k + 1), k + max_bands, n)
+        yield from tile_histograms(img, row_edges[k:stop + 1], col_edges, max_workers)
+        k = stop
+
+@roi_aware(margin=0)
+def hist_equalization(img, return_lut=False, max_workers=None, batch=False):
     """
     Cân bằng lược đồ mức xám toàn cục (Global Histogram Equalization)
+
+    batch=True: `img` là stack (N, H, W) - mỗi ảnh được cân bằng riêng nhưng cả
+    stack được xử lý trong một lần gọi (histogram và tra bảng vector hóa).
+    return_lut=True trả về (ảnh, LUT 256 mức) - với stack là (stack, LUT (N, 256))
+    max_workers: số thread tính histogram của ảnh lớn (xem tile_histograms)
     """
     # Kiểm tra đầu vào phải là ảnh xám kiểu uint8
-    if len(img.shape) != 2 or img.dtype != np.uint8:
-        raise ValueError("Đầu vào phải là ảnh xám (grayscale) với kiểu dữ liệu uint8")
-    # Tính histogram của ảnh
-    hist, bins = np.histogram(img.flatten(), 256, [0,256])
-    # Tính hàm phân phối tích lũy (CDF)
-    cdf = hist.cumsum()
-    # Loại bỏ các giá trị bằng 0 trong CDF
-    cdf_masked = np.ma.masked_equal(cdf, 0)
-    # Tìm giá trị nhỏ nhất và lớn nhất của CDF
-    cdf_min = cdf_masked.min()
-    cdf_max = cdf_masked.max()
-    # Chuẩn hóa CDF về khoảng [0, 255]
-    cdf_masked = (cdf_masked - cdf_min) * 255 / (cdf_max - cdf_min)
-    # Điền lại các giá trị đã loại bỏ bằng 0 và chuyển về kiểu uint8
-    cdf_final = np.ma.filled(cdf_masked, 0).astype('uint8')
+    stack = _as_stack(img, batch)
+    # Tính histogram của từng ảnh (một ảnh: song song theo dải hàng)
+    if batch:
+        hists = stack_histograms(stack)
+    else:
+        hists = tile_histograms(img, (0, img.shape[0]), (0, img.shape[1]), max_workers)[0]
     # Tra cứu giá trị mới cho từng pixel dựa vào CDF
-    img_eq = cdf_final[img]
-    return img_eq
+    luts = equalization_lut(hists)
+    img_eq = stack_lut_apply(stack, luts)
+    if not batch:
+        img_eq, luts = img_eq[0], luts[0]
+    return (img_eq, luts) if return_lut else img_eq
+
+def equalization_lut(hist):
+    """
+    LUT 256 mức của cân bằng histogram toàn cục, tính từ histogram 256 bin
+    (dùng chung cho hist_equalization, CLAHE và cân bằng theo nhiều tile - processing.tiles).
+    Nhận một histogram (256,) hoặc nhiều histogram (N, 256).
+    """
+    # Tính hàm phân phối tích lũy (CDF)
+    cdf = np.asarray(hist).cumsum(axis=-1)
+    # Bỏ qua các giá trị bằng 0 trong CDF khi tìm min
+    nonzero = cdf > 0
+    cdf_min = np.where(nonzero, cdf, cdf[..., -1:]).min(axis=-1, keepdims=True)
+    cdf_max = cdf[..., -1:]
+    # Chuẩn hóa CDF về khoảng [0, 255] (CDF hằng -> 0, như khi chia cho 0 bị che)
+    denominator = cdf_max - cdf_min
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cdf_normalized = (cdf - cdf_min) * 255 / denominator
+    cdf_normalized = np.where(nonzero & (denominator > 0), cdf_normalized, 0)
+    return cdf_normalized.astype('uint8')
 
-def clahe_equalization(img, clip=2.0, grid=8):
+@roi_aware(margin=0, min_size=lambda p: p["grid"])
+def clahe_equalization(img, clip=2.0, grid=8, max_workers=None, batch=False):
     """
     Cân bằng lược đồ mức xám thích ứng có giới hạn (CLAHE - Contrast Limited Adaptive Histogram Equalization)
     
@@ -33,43 +216,45 @@ def clahe_equalization(img, clip=2.0, grid=8):
         img: Ảnh xám đầu vào (uint8)
         clip: Giới hạn clipping cho histogram
         grid: Số lượng tile theo mỗi chiều (grid x grid)
+        max_workers: số thread tính histogram các tile (xem tile_histograms)
+        batch: `img` là stack (N, H, W) - mỗi tile được xử lý cho cả stack cùng lúc
     """
     # Kiểm tra đầu vào phải là ảnh xám kiểu uint8
-    if len(img.shape) != 2 or img.dtype != np.uint8:
-        raise ValueError("Đầu vào phải là ảnh xám (grayscale) với kiểu dữ liệu uint8")
-    h, w = img.shape
+    stack = _as_stack(img, batch)
+    h, w = stack.shape[1:]
+    # Ảnh nhỏ hơn lưới: giảm số tile để mỗi tile có ít nhất một pixel
+    grid = max(1, min(grid, h, w))
     # Chia ảnh thành các vùng nhỏ (tile)
     tile_h, tile_w = h // grid, w // grid
-    result = np.zeros_like(img)
+    tile_hists = None
+    if len(stack) == 1:
+        # Một ảnh: histogram của mọi tile trong một lượt, song song theo dải hàng
+        tile_hists = tile_histograms(stack[0], [i * tile_h for i in range(grid)] + [h],
+                                     [j * tile_w for j in range(grid)] + [w], max_workers)
+    result = np.zeros_like(stack)
     for i in range(grid):
         for j in range(grid):
             # Xác định vùng tile hiện tại
             y0, y1 = i * tile_h, (i + 1) * tile_h if i < grid - 1 else h
             x0, x1 = j * tile_w, (j + 1) * tile_w if j < grid - 1 else w
-            tile = img[y0:y1, x0:x1]
-            # Tính histogram cho tile
-            hist, bins = np.histogram(tile.flatten(), 256, [0,256])
+            tile = stack[:, y0:y1, x0:x1]
+            # Tính histogram cho tile (của từng ảnh)
+            hist = tile_hists[i, j][None] if tile_hists is not None else stack_histograms(tile)
             # Giới hạn giá trị histogram (clip)
-            clip_limit = int(clip * tile.size / 256)
+            clip_limit = int(clip * (y1 - y0) * (x1 - x0) / 256)
             excess = hist - clip_limit  # Tính phần dư vượt quá clip
             excess[excess < 0] = 0
-            n_excess = excess.sum()  # Tổng phần dư
+            n_excess = excess.sum(axis=1, keepdims=True)  # Tổng phần dư
             hist = np.minimum(hist, clip_limit)  # Áp dụng clip
             # Phân phối lại phần dư cho các mức xám
             hist += n_excess // 256
-            # Tính CDF cho tile
-            cdf = hist.cumsum()
-            cdf_masked = np.ma.masked_equal(cdf, 0)
-            cdf_min = cdf_masked.min()
-            cdf_max = cdf_masked.max()
-            cdf_masked = (cdf_masked - cdf_min) * 255 / (cdf_max - cdf_min)
-            cdf_final = np.ma.filled(cdf_masked, 0).astype('uint8')
             # Tra cứu giá trị mới cho tile dựa vào CDF
-            result[y0:y1, x0:x1] = cdf_final[tile]
+            result[:, y0:y1, x0:x1] = stack_lut_apply(tile, equalization_lut(hist))
     # Trả về ảnh sau CLAHE
-    return result
+    return result if batch else result[0]
 
-def ahe_equalization(img, window_size=64):
+@roi_aware(margin=lambda p: p["window_size"] // 2)
+def ahe_equalization(img, window_size=64, batch=False):
     """
     Cân bằng lược đồ mức xám thích ứng (Adaptive Histogram Equalization - AHE)
     Tối ưu hóa cho tốc độ bằng cách sử dụng vectorization
@@ -77,7 +262,11 @@ def ahe_equalization(img, window_size=64):
     Args:
         img: Ảnh xám đầu vào (uint8)
         window_size: Kích thước cửa sổ local (mặc định 64x64)
+        batch: `img` là stack (N, H, W)
     """
+    if batch:
+        # Cửa sổ trượt không gộp được giữa các ảnh -> xử lý lần lượt
+        return np.stack([ahe_equalization(frame, window_size) for frame in _as_stack(img, batch)])
     if len(img.shape) != 2 or img.dtype != np.uint8:
         raise ValueError("Đầu vào phải là ảnh xám (grayscale) với kiểu dữ liệu uint8")
     
@@ -107,7 +296,7 @@ def ahe_equalization(img, window_size=64):
                 local_window = padded_img[y_start:y_end, x_start:x_end]
                 
                 # Tính histogram cho window local
-                hist, _ = np.histogram(local_window.flatten(), 256, [0, 256])
+                hist = backends.histogram(local_window)
                 
                 # Tính CDF
                 cdf = hist.cumsum()
@@ -129,6 +318,9 @@ def ahe_equalization(img, window_size=64):
     
     return result
 
+# Cửa sổ lớn nhất mà auto_optimize_ahe_params chọn
+AHE_MAX_WINDOW = 128
+
 def auto_optimize_ahe_params(img):
     """
     Tự động tối ưu parameters cho AHE dựa trên đặc điểm ảnh
@@ -165,7 +357,7 @@ def auto_optimize_ahe_params(img):
         window_size = max(32, window_size // 2)
         step_size = max(4, step_size // 2)
     elif entropy > 7.5:  # High contrast
-        window_size = min(128, int(window_size * 1.2))
+        window_size = min(AHE_MAX_WINDOW, int(window_size * 1.2))
         step_size = min(16, int(step_size * 1.5))
     
     # 4. Kiểm tra noise level (dựa trên local variance)
@@ -253,34 +445,50 @@ def auto_optimize_ahe_params(img):
     
     return result
 
-def ahe_equalization_fast(img, window_size=None, step_size=None):
+@roi_aware(margin=lambda p: (p["window_size"] or AHE_MAX_WINDOW) // 2)
+def ahe_equalization_fast(img, window_size=None, step_size=None, max_pixels=1000000, max_workers=None,
+                          batch=False):
     """
     AHE tối ưu tốc độ với auto parameters
+
+    Args:
+        max_pixels: Ảnh lớn hơn ngưỡng này được thu nhỏ trước khi xử lý rồi
+            phóng to lại (xem `processing.planner` để chọn theo ngân sách thời gian)
+        max_workers: số thread tính histogram (xem tile_histograms)
+        batch: `img` là stack (N, H, W)
     """
+    if batch:
+        # Tham số tự động và lưới cửa sổ riêng cho từng ảnh -> xử lý lần lượt
+        return np.stack([ahe_equalization_fast(frame, window_size, step_size, max_pixels, max_workers)
+                         for frame in _as_stack(img, batch)])
+    if len(img.shape) != 2 or img.dtype != np.uint8:
+        raise ValueError("Đầu vào phải là ảnh xám (grayscale) với kiểu dữ liệu uint8")
+
     if window_size is None or step_size is None:
         # Tự động tối ưu parameters
         auto_window, auto_step = auto_optimize_ahe_params(img)
         window_size = window_size or auto_window
         step_size = step_size or auto_step
     
-    if len(img.shape) != 2 or img.dtype != np.uint8:
-        raise ValueError("Đầu vào phải là ảnh xám (grayscale) với kiểu dữ liệu uint8")
-    
     h, w = img.shape
     result = img.copy().astype(np.float32)
     
     # Tối ưu: Giới hạn kích thước ảnh để tránh quá chậm
-    if h * w > 1000000:  # > 1M pixels
+    if max_pixels and h * w > max_pixels:
         # Resize xuống để xử lý nhanh
         from PIL import Image
-        scale = np.sqrt(1000000 / (h * w))
+        from utils.pyramid import pyramid_for
+        scale = np.sqrt(max_pixels / (h * w))
         new_h, new_w = int(h * scale), int(w * scale)
-        img_small = np.array(Image.fromarray(img).resize((new_w, new_h), Image.LANCZOS))
+        # Resize từ mức pyramid gần nhất (dùng chung với histogram/preview) thay vì từ ảnh gốc
+        source = pyramid_for(img).level_for_pixels(max_pixels, above=True)
+        img_small = np.array(Image.fromarray(source).resize((new_w, new_h), Image.LANCZOS))
         
         # Xử lý ảnh nhỏ
         result_small = ahe_equalization_fast(img_small, 
                                            max(32, window_size // 2), 
-                                           max(4, step_size // 2))
+                                           max(4, step_size // 2),
+                                           max_pixels=None, max_workers=max_workers)
         
         # Resize lại về kích thước gốc
         result = np.array(Image.fromarray(result_small).resize((w, h), Image.LANCZOS))
@@ -288,34 +496,42 @@ def ahe_equalization_fast(img, window_size=None, step_size=None):
     
     # AHE processing với step_size để tăng tốc
     half_window = window_size // 2
+    rows = np.arange(0, h, step_size)
+    cols = np.arange(0, w, step_size)
+    # Vùng local của điểm lưới (i, j): img[y1:y2, x1:x2]
+    y1s, y2s = np.maximum(rows - half_window, 0), np.minimum(rows + half_window, h)
+    x1s, x2s = np.maximum(cols - half_window, 0), np.minimum(cols + half_window, w)
     
-    for i in range(0, h, step_size):
-        for j in range(0, w, step_size):
-            # Xác định vùng local
-            y1 = max(0, i - half_window)
-            y2 = min(h, i + half_window)
-            x1 = max(0, j - half_window)
-            x2 = min(w, j + half_window)
-            
-            # Lấy local region
-            local_region = img[y1:y2, x1:x2]
-            
-            # Tính histogram và CDF
-            hist = np.histogram(local_region, bins=256, range=(0, 255))[0]
-            cdf = np.cumsum(hist).astype(np.float32)
-            
-            # Normalize CDF
-            cdf_min = cdf[cdf > 0].min() if (cdf > 0).any() else 0
-            cdf_normalized = (cdf - cdf_min) * 255 / (cdf[-1] - cdf_min) if cdf[-1] > cdf_min else cdf
-            
-            # Áp dụng cho vùng step_size x step_size
-            i_end = min(i + step_size, h)
-            j_end = min(j + step_size, w)
-            
-            for ii in range(i, i_end):
-                for jj in range(j, j_end):
-                    if 0 <= ii < h and 0 <= jj < w:
-                        pixel_val = img[ii, jj]
-                        result[ii, jj] = cdf_normalized[pixel_val]
+    # Histogram mọi vùng local trên một hàng lưới = hiệu tổng tích lũy theo cột của dải
+    # img[y1:y2] (chia theo biên cột các vùng). Dải được cập nhật dần: cộng các hàng vừa
+    # vào (y2 tăng), trừ các hàng vừa ra (y1 tăng) -> mỗi pixel chỉ được đếm hai lần
+    col_edges = np.unique(np.concatenate([x1s, x2s]))
+    c1, c2 = np.searchsorted(col_edges, x1s), np.searchsorted(col_edges, x2s)
+    entering = _row_band_histograms(img, np.concatenate([[0], y2s]), col_edges, max_workers)
+    leaving = _row_band_histograms(img, np.concatenate([[0], y1s]), col_edges, max_workers)
+    strip = np.zeros((len(col_edges) - 1, 256), dtype=np.int64)
+    strip_cumsum = np.zeros((len(col_edges), 256), dtype=np.int64)
+    col_block = np.arange(w) // step_size
+    
+    for i in rows:
+        strip += next(entering)
+        strip -= next(leaving)
+        np.cumsum(strip, axis=0, out=strip_cumsum[1:])
+        hists = strip_cumsum[c2] - strip_cumsum[c1]
+        
+        # Tính CDF của từng vùng
+        cdf = np.cumsum(hists, axis=1).astype(np.float32)
+        
+        # Normalize CDF (vùng không có variation giữ nguyên CDF)
+        positive = cdf > 0
+        cdf_min = np.where(positive, cdf, np.float32(np.inf)).min(axis=1, keepdims=True)
+        cdf_min[~positive.any(axis=1)] = 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cdf_normalized = (cdf - cdf_min) * 255 / (cdf[:, -1:] - cdf_min)
+        cdf_normalized = np.where(cdf[:, -1:] > cdf_min, cdf_normalized, cdf)
+        
+        # Áp dụng cho các vùng step_size x step_size của hàng lưới
+        i_end = min(i + step_size, h)
+        result[i:i_end] = cdf_normalized[col_block, img[i:i_end]]
     
     return np.clip(result, 0, 255).astype(np.uint8)
@@ -1,46 +1,111 @@
 import numpy as np
-import cv2
 
-def negative(img):
+from . import backends
+
+def _apply_lut(img, lut):
+    """
+    Tra bảng cho ảnh xám, ảnh màu hoặc stack ảnh (N, H, W[, C]) trong một lần gọi
+    """
+    if img.ndim == 2 or (img.ndim == 3 and img.shape[2] <= 4):
+        return backends.lut_apply(img, lut)
+    # Stack: gộp về mảng 2 chiều (cv2.LUT giới hạn số kênh)
+    return backends.lut_apply(img.reshape(-1, img.shape[-1]), lut).reshape(img.shape)
+
+def negative(img, return_lut=False):
+    """
+    Âm bản: s = 255 - r (ảnh đơn hoặc stack ảnh)
+
+    return_lut=True trả về (ảnh, LUT 256 mức) - dùng để suy ra histogram đầu ra
+    mà không cần quét lại ảnh (utils.plot.lut_histogram)
+    """
+    if return_lut:
+        return 255 - img, (255 - np.arange(256)).astype(np.uint8)
     return 255 - img
 
-def log_transform(img, c=1):
+def log_transform(img, c=1, batch=False):
     """
     Thực hiện biến đổi logarithm: s = c * log(1 + r)
     
     Args:
         img: Ảnh đầu vào (grayscale, uint8)
         c: Hệ số scaling (range từ 0.1 đến 50 để thấy rõ sự khác biệt)
+        batch: `img` là stack (N, H, W[, C]) - mỗi ảnh được chuẩn hóa min-max riêng.
+            Stack 4 chiều luôn được coi là batch.
     """
+    if batch or img.ndim == 4:
+        return _log_transform_stack(img, c)
+
     # Chuyển ảnh về float64 để tránh overflow với c lớn
     img_float = img.astype(np.float64) / 255.0
     
     # Áp dụng log transform với range rộng hơn
-    if c > 10:
-        # Với c lớn, sử dụng scaling đặc biệt để tránh overflow
-        log_img = c * np.log1p(img_float * 10) / 10
-    else:
-        # Với c nhỏ, dùng công thức thông thường
-        log_img = c * np.log1p(img_float)
+    log_img = _log_curve(img_float, c)
     
-    # Chuẩn hóa kết quả về [0, 255] để tận dụng toàn bộ dynamic range
-    log_img = cv2.normalize(log_img, None, 0, 255, cv2.NORM_MINMAX)
+    # Chuẩn hóa kết quả về [0, 255] để tận dụng toàn bộ dynamic range (min-max)
+    lo, hi = log_img.min(), log_img.max()
+    if hi > lo:
+        log_img = (log_img - lo) * (255.0 / (hi - lo))
+    else:
+        log_img = np.zeros_like(log_img)
     
     # Chuyển về uint8 cho hiển thị
     return log_img.astype(np.uint8)
 
-def gamma_correction(img, gamma=1.0, c=1.0):
+def _log_curve(img_float, c):
+    # Áp dụng log transform với range rộng hơn
+    if c > 10:
+        # Với c lớn, sử dụng scaling đặc biệt để tránh overflow
+        return c * np.log1p(img_float * 10) / 10
+    # Với c nhỏ, dùng công thức thông thường
+    return c * np.log1p(img_float)
+
+def _log_transform_stack(stack, c):
+    """
+    log_transform cho stack (N, ...): chuẩn hóa min-max riêng từng ảnh.
+    Với uint8, hàm log đơn điệu nên min/max của ảnh sau biến đổi suy ra từ mức xám
+    nhỏ nhất/lớn nhất -> mỗi ảnh một LUT 256 mức, áp dụng bằng stack_lut_apply.
+    """
+    n = stack.shape[0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if stack.dtype != np.uint8:
+            log_img = _log_curve(stack.astype(np.float64) / 255.0, c)
+            axes = tuple(range(1, stack.ndim))
+            lo = log_img.min(axis=axes, keepdims=True)
+            hi = log_img.max(axis=axes, keepdims=True)
+            return np.where(hi > lo, (log_img - lo) * (255.0 / (hi - lo)), 0).astype(np.uint8)
+        from .histogram import stack_lut_apply
+        curve = _log_curve(np.arange(256, dtype=np.float64) / 255.0, c)
+        flat = stack.reshape(n, -1)
+        ends = curve[np.stack([flat.min(axis=1), flat.max(axis=1)], axis=1)]
+        lo, hi = ends.min(axis=1, keepdims=True), ends.max(axis=1, keepdims=True)
+        luts = np.where(hi > lo, (curve - lo) * (255.0 / (hi - lo)), 0).astype(np.uint8)
+    return stack_lut_apply(stack, luts)
+
+def _gamma_lut(gamma, c):
+    """LUT 256 mức của gamma correction (cùng công thức với bản tính trên từng pixel)"""
+    r = np.arange(256, dtype=np.float32) / 255.0
+    return np.clip(c * np.power(r, gamma) * 255, 0, 255).astype(np.uint8)
+
+def gamma_correction(img, gamma=1.0, c=1.0, return_lut=False):
     """
     Gamma correction (Power-law transformation): s = c * r^gamma
     
     Args:
-        img: Ảnh đầu vào
+        img: Ảnh đầu vào (ảnh đơn hoặc stack (N, H, W[, C]))
         gamma: Tham số power
             - gamma < 1: Tăng cường vùng tối (dark regions)
             - gamma > 1: Tăng cường vùng sáng (bright regions) 
             - gamma = 1: Không thay đổi (linear)
         c: Hằng số scaling (mặc định = 1)
+        return_lut: trả về (ảnh, LUT 256 mức) thay vì chỉ ảnh; ảnh không phải uint8
+            không tra bảng nên LUT là None
     """
+    if img.dtype == np.uint8:
+        # Ảnh uint8: tính 256 giá trị rồi tra bảng
+        lut = _gamma_lut(gamma, c)
+        result = _apply_lut(img, lut)
+        return (result, lut) if return_lut else result
+
     # Chuẩn hóa về [0,1]
     img_normalized = img.astype(np.float32) / 255.0
     
@@ -50,7 +115,8 @@ def gamma_correction(img, gamma=1.0, c=1.0):
     # Clip và chuyển về [0,255]
     transformed = np.clip(transformed * 255, 0, 255)
     
-    return transformed.astype(np.uint8)
+    result = transformed.astype(np.uint8)
+    return (result, None) if return_lut else result
 
 def _piecewise_lut(r1: int, s1: int, r2: int, s2: int) -> np.ndarray:
     """
@@ -81,18 +147,17 @@ def _piecewise_lut(r1: int, s1: int, r2: int, s2: int) -> np.ndarray:
         lut[255] = s2
     return np.clip(lut, 0, 255).astype(np.uint8)
 
-def piecewise_linear(img: np.ndarray, r1: int, s1: int, r2: int, s2: int) -> np.ndarray:
+def piecewise_linear(img: np.ndarray, r1: int, s1: int, r2: int, s2: int, return_lut: bool = False):
     """
     Biến đổi tuyến tính từng đoạn (Piecewise-linear).
-    - Áp dụng LUT cho ảnh xám hoặc từng kênh của ảnh màu.
+    - Áp dụng LUT cho ảnh xám, từng kênh của ảnh màu hoặc cả stack (N, H, W[, C]).
     - Thường dùng cho contrast stretching.
+    - return_lut=True trả về (ảnh, LUT).
     """
     lut = _piecewise_lut(r1, s1, r2, s2)
-    if img.ndim == 2:
-        return lut[img]
-    elif img.ndim == 3:
-        # Áp dụng theo từng kênh
-        channels = [lut[img[..., c]] for c in range(img.shape[2])]
-        return np.stack(channels, axis=-1)
+    if img.ndim in (2, 3, 4):
+        # Ảnh màu / stack: cùng một LUT cho mọi kênh, mọi ảnh
+        result = _apply_lut(img, lut)
+        return (result, lut) if return_lut else result
     else:
-        raise ValueError("Ảnh đầu vào phải là ảnh xám hoặc ảnh màu RGB")
+        raise ValueError("Ảnh đầu vào phải là ảnh xám, ảnh màu RGB hoặc stack ảnh")
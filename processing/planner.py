@@ -0,0 +1,283 @@
+"""
+Chọn biến thể thuật toán theo ngân sách thời gian (latency budget).
+
+Thay cho các ngưỡng số điểm ảnh cố định (1M cho AHE, 2M cho adaptive threshold),
+planner dùng một cost model tuyến tính được đo một lần trên máy đang chạy
+(lưu cache trên đĩa), rồi chọn biến thể chất lượng cao nhất vừa ngân sách:
+
+    plan = plan_ahe(img.shape, budget_s=2.0)
+    result, report = run_plan(img, plan)
+    print(report)  # plan đã chọn, thời gian dự đoán và thực tế
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from utils.disk_cache import host_signature, load_json, save_json
+
+MODEL_VERSION = 3
+_CACHE_FILE = "planner_cost_model.json"
+
+# Các mức độ phân giải (số điểm ảnh) được thử khi phải thu nhỏ ảnh
+PIXEL_TARGETS = (4000000, 2000000, 1000000, 500000, 250000, 125000)
+AHE_STEPS = (4, 6, 8, 12, 16)
+
+Plan = namedtuple("Plan", ["algorithm", "params", "predicted_s", "quality"])
+
+
+# --- Đặc trưng (features) cho từng biến thể: thời gian ~ dot(coef, features) ---
+
+def _ahe_fast_model(step_size):
+    # Chi phí AHE grid không tỉ lệ đơn giản với số ô lưới (step 4 và 6 gần như bằng nhau,
+    # gấp ~5 lần step 12) và gần như không phụ thuộc window -> mỗi step một model
+    return f"ahe_fast_{step_size}"
+
+
+def _ahe_fast_features(h, w):
+    return [1.0, h * w]
+
+
+def _ahe_exact_features(h, w, window_size):
+    n_windows = h * math.ceil(w / 10)
+    return [1.0, n_windows, n_windows * window_size * window_size, h * w]
+
+
+def _threshold_features(h, w):
+    return [1.0, h * w]
+
+
+def _resize_features(src_pixels, dst_pixels):
+    return [1.0, src_pixels + dst_pixels]
+
+
+def _timeit(func, repeat=3):
+    # Trung vị thay vì thời gian tốt nhất: lần gọi thực tế không luôn chạy với cache nóng
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+
+# Ảnh đại diện để kiểm tra model: thời gian dự đoán phải tăng theo số điểm ảnh
+_GROWTH_PROBES = {
+    **{_ahe_fast_model(step): _ahe_fast_features for step in AHE_STEPS},
+    "ahe_exact": lambda h, w: _ahe_exact_features(h, w, 64),
+    "threshold": _threshold_features,
+    "resize": lambda h, w: _resize_features(h * w, h * w // 4),
+}
+# Cột feature chính (khối lượng công việc) của từng model - dùng cho model dự phòng
+_WORK_FEATURE = {**{_ahe_fast_model(step): 1 for step in AHE_STEPS},
+                 "ahe_exact": 2, "threshold": 1, "resize": 1}
+
+
+def _fit(rows):
+    """
+    Least squares không âm (NNLS) theo sai số tương đối: mỗi mẫu chia cho thời gian đo
+    được, để ảnh nhỏ (chi phí cố định mỗi lần gọi chiếm phần lớn) không bị ảnh lớn lấn át
+    """
+    from scipy.optimize import nnls
+
+    X = np.array([r[0] for r in rows], dtype=np.float64)
+    y = np.array([r[1] for r in rows], dtype=np.float64)
+    if len(rows) <= X.shape[1]:
+        raise ValueError("Cần nhiều mẫu đo hơn số feature để fit cost model")
+    weights = 1.0 / np.maximum(y, 1e-6)
+    X, y = X * weights[:, None], y * weights
+    # Chuẩn hóa cột để tránh ill-conditioning (các feature chênh nhau nhiều bậc)
+    scale = np.maximum(X.max(axis=0), 1e-12)
+    return (nnls(X / scale, y)[0] / scale).tolist()
+
+
+def _grows_with_pixels(name, coef):
+    """Model hợp lệ khi ảnh lớn hơn 16 lần (số điểm ảnh) được dự đoán chậm hơn ít nhất 2 lần"""
+    small = _predict({name: coef}, name, _GROWTH_PROBES[name](256, 256))
+    large = _predict({name: coef}, name, _GROWTH_PROBES[name](1024, 1024))
+    return small > 0 and large >= 2 * small
+
+
+def _fit_checked(name, rows):
+    """
+    NNLS; nếu model không tăng theo số điểm ảnh (ví dụ dồn hết vào hệ số hằng) thì dùng
+    model tỉ lệ với feature khối lượng công việc chính
+    """
+    coef = _fit(rows)
+    if _grows_with_pixels(name, coef):
+        return coef
+    k = _WORK_FEATURE[name]
+    x = np.array([r[0][k] for r in rows], dtype=np.float64)
+    y = np.array([r[1] for r in rows], dtype=np.float64)
+    coef = [0.0] * len(rows[0][0])
+    coef[k] = float(x @ y / (x @ x))
+    return coef
+
+
+def calibrate():
+    """
+    Đo thời gian từng biến thể trên ảnh tổng hợp và fit cost model.
+    Mỗi model được đo ở nhiều kích thước hơn hẳn số feature, từ ảnh rất nhỏ (chi phí
+    cố định mỗi lần gọi - feature hằng số 1.0) tới ảnh lớn.
+    Mất khoảng vài giây, chỉ chạy một lần cho mỗi máy (xem warm_up).
+    """
+    from PIL import Image
+    from .histogram import ahe_equalization, ahe_equalization_fast
+    from .applications import adaptive_threshold_custom
+
+    rng = np.random.default_rng(0)
+
+    def sample(h, w):
+        # Ảnh có cấu trúc (gradient + nhiễu) để giống ảnh thật hơn ảnh nhiễu thuần
+        base = np.add.outer(np.linspace(0, 160, h), np.linspace(0, 80, w))
+        return np.clip(base + rng.normal(0, 20, (h, w)), 0, 255).astype(np.uint8)
+
+    rows = {name: [] for name in _GROWTH_PROBES}
+    for h, w in [(48, 64), (96, 96), (128, 192), (192, 192), (256, 320), (384, 512)]:
+        img = sample(h, w)
+        for step in AHE_STEPS:
+            t = _timeit(lambda: ahe_equalization_fast(img, 64, step, max_pixels=None))
+            rows[_ahe_fast_model(step)].append((_ahe_fast_features(h, w), t))
+    for h, w in [(24, 32), (32, 48), (48, 64), (64, 80), (80, 96), (128, 128)]:
+        img = sample(h, w)
+        # Window nhỏ và lớn (tới 64 như app) để tách chi phí mỗi cửa sổ và theo diện tích
+        for window in (16, 64):
+            t = _timeit(lambda: ahe_equalization(img, window))
+            rows["ahe_exact"].append((_ahe_exact_features(h, w, window), t))
+    for h, w in [(64, 64), (128, 128), (256, 256), (384, 512), (512, 512), (768, 768), (1024, 1024)]:
+        img = sample(h, w)
+        t = _timeit(lambda: adaptive_threshold_custom(img, max_pixels=None))
+        rows["threshold"].append((_threshold_features(h, w), t))
+        pil = Image.fromarray(img)
+        t = _timeit(lambda: np.array(pil.resize((w // 2, h // 2), Image.LANCZOS)))
+        rows["resize"].append((_resize_features(h * w, h * w // 4), t))
+
+    model = {name: _fit_checked(name, r) for name, r in rows.items()}
+    model["host"] = host_signature()
+    model["version"] = MODEL_VERSION
+    return model
+
+
+_model = None
+# Chỉ một thread đo/đọc cost model (nhiều session hoặc thread gọi planner cùng lúc)
+_model_lock = threading.Lock()
+
+
+def get_cost_model(recalibrate=False):
+    """Cost model của máy hiện tại (đọc từ cache, hoặc đo nếu chưa có)"""
+    global _model
+    if _model is not None and not recalibrate:
+        return _model
+    with _model_lock:
+        if _model is not None and not recalibrate:
+            return _model
+        model = None if recalibrate else load_json(_CACHE_FILE)
+        if not model or model.get("host") != host_signature() or model.get("version") != MODEL_VERSION:
+            model = calibrate()
+            save_json(_CACHE_FILE, model)
+        _model = model
+    return model
+
+
+def warm_up():
+    """
+    Đọc (hoặc đo lần đầu trên máy) lựa chọn backend và cost model. Gọi khi khởi động
+    app / CLI để calibration không rơi vào pipeline đầu tiên (vốn có ngân sách thời gian).
+    """
+    from . import backends
+    backends.warm_up()
+    get_cost_model()
+
+
+def _predict(model, name, features):
+    return float(np.dot(model[name], features))
+
+
+def _downscaled_shape(h, w, max_pixels):
+    # Giống cách tính trong ahe_equalization_fast / adaptive_threshold_custom
+    scale = np.sqrt(max_pixels / (h * w))
+    return int(h * scale), int(w * scale)
+
+
+def plan_ahe(shape, budget_s, window_size=64, allow_exact=True, model=None):
+    """
+    Chọn biến thể AHE cho ảnh kích thước `shape` trong ngân sách `budget_s` giây.
+
+    Thứ tự chất lượng: AHE chính xác > AHE grid ở độ phân giải gốc (step nhỏ hơn tốt hơn)
+    > AHE grid trên ảnh thu nhỏ (càng ít thu nhỏ càng tốt).
+    Nếu không biến thể nào vừa ngân sách thì chọn biến thể nhanh nhất.
+    """
+    model = model or get_cost_model()
+    h, w = shape[:2]
+    candidates = []
+    if allow_exact:
+        t = _predict(model, "ahe_exact", _ahe_exact_features(h, w, window_size))
+        candidates.append(Plan("ahe_exact", {"window_size": window_size}, t, 2.0))
+    for max_pixels in (None,) + PIXEL_TARGETS:
+        if max_pixels is not None and h * w <= max_pixels:
+            continue
+        for step in AHE_STEPS:
+            params = {"window_size": window_size, "step_size": step, "max_pixels": max_pixels}
+            if max_pixels is None:
+                t = _predict(model, _ahe_fast_model(step), _ahe_fast_features(h, w))
+                fraction = 1.0
+            else:
+                sh, sw = _downscaled_shape(h, w, max_pixels)
+                # ahe_equalization_fast chia đôi window/step khi xử lý ảnh thu nhỏ
+                t = (_predict(model, "resize", _resize_features(h * w, sh * sw)) * 2
+                     + _predict(model, _ahe_fast_model(max(4, step // 2)), _ahe_fast_features(sh, sw)))
+                fraction = sh * sw / (h * w)
+            # Độ phân giải quan trọng hơn step: giữ nguyên thứ tự đó trong điểm chất lượng
+            quality = fraction - step / 1000.0
+            candidates.append(Plan("ahe_fast", params, t, quality))
+    return _choose(candidates, budget_s)
+
+
+def plan_threshold(shape, budget_s, model=None):
+    """Chọn độ phân giải xử lý cho adaptive_threshold_custom theo ngân sách"""
+    model = model or get_cost_model()
+    h, w = shape[:2]
+    candidates = [Plan("threshold", {"max_pixels": None},
+                       _predict(model, "threshold", _threshold_features(h, w)), 1.0)]
+    for max_pixels in PIXEL_TARGETS:
+        if h * w <= max_pixels:
+            continue
+        sh, sw = _downscaled_shape(h, w, max_pixels)
+        t = (_predict(model, "resize", _resize_features(h * w, sh * sw)) * 2
+             + _predict(model, "threshold", _threshold_features(sh, sw)))
+        candidates.append(Plan("threshold", {"max_pixels": max_pixels}, t, sh * sw / (h * w)))
+    return _choose(candidates, budget_s)
+
+
+def _choose(candidates, budget_s):
+    within = [p for p in candidates if p.predicted_s <= budget_s]
+    if within:
+        return max(within, key=lambda p: p.quality)
+    return min(candidates, key=lambda p: p.predicted_s)
+
+
+def run_plan(img, plan, **extra):
+    """
+    Chạy plan trên ảnh, trả về (kết quả, báo cáo). Báo cáo gồm plan đã chọn,
+    thời gian dự đoán và thời gian thực tế.
+    """
+    from .histogram import ahe_equalization, ahe_equalization_fast
+    from .applications import adaptive_threshold_custom
+
+    funcs = {
+        "ahe_exact": ahe_equalization,
+        "ahe_fast": ahe_equalization_fast,
+        "threshold": adaptive_threshold_custom,
+    }
+    t0 = time.perf_counter()
+    result = funcs[plan.algorithm](img, **plan.params, **extra)
+    actual = time.perf_counter() - t0
+    report = {
+        "algorithm": plan.algorithm,
+        "params": plan.params,
+        "predicted_s": round(plan.predicted_s, 4),
+        "actual_s": round(actual, 4),
+    }
+    return result, report
@@ -0,0 +1,112 @@
+"""
+Xử lý theo vùng quan tâm (Region of Interest - ROI).
+
+Chỉ tính trên các hình chữ nhật được chọn (cộng thêm một lề ngữ cảnh cho các phép
+lân cận như cửa sổ adaptive threshold), rồi dán kết quả về ảnh gốc. Các thống kê
+(percentile, tile CLAHE, histogram) vì vậy được tính trên ROI chứ không phải cả ảnh,
+và chi phí tỉ lệ với diện tích ROI:
+
+    plate = enhance_license_plate(frame, rois=[(x, y, 200, 60)])
+"""
+import functools
+import inspect
+
+import numpy as np
+
+from . import backends
+
+
+def normalize_rois(rois, shape):
+    """
+    Chuẩn hóa danh sách ROI về (x, y, w, h) nguyên, nằm trong ảnh.
+    Chấp nhận một ROI đơn lẻ hoặc danh sách ROI.
+    """
+    if len(rois) == 4 and np.isscalar(rois[0]):
+        rois = [rois]
+    h, w = shape[:2]
+    result = []
+    for x, y, rw, rh in rois:
+        x0, y0 = max(0, int(x)), max(0, int(y))
+        x1, y1 = min(w, int(x) + int(rw)), min(h, int(y) + int(rh))
+        if x1 > x0 and y1 > y0:
+            result.append((x0, y0, x1 - x0, y1 - y0))
+    return result
+
+
+def _paste_base(img, sample):
+    """Ảnh nền để dán kết quả ROI (cùng số kênh với kết quả)"""
+    if sample.ndim == img.ndim:
+        return img.astype(sample.dtype, copy=True)
+    if sample.ndim == 2:
+        return backends.rgb_to_gray(img).astype(sample.dtype)
+    return np.repeat(img[..., None], sample.shape[2], axis=2).astype(sample.dtype)
+
+
+def _window(arr, ys, xs, batch):
+    # Cắt theo hai chiều không gian: (H, W[, C]) hoặc stack (N, H, W) khi batch
+    return arr[:, ys, xs] if batch else arr[ys, xs]
+
+
+def _grow(lo, hi, size, limit):
+    # Mở rộng đoạn [lo, hi) đều hai phía cho tới ít nhất `size` (trong [0, limit))
+    size = min(size, limit)
+    if hi - lo >= size:
+        return lo, hi
+    lo = max(0, min(lo - (size - (hi - lo)) // 2, limit - size))
+    return lo, lo + size
+
+
+def process_rois(func, img, rois, margin=0, min_size=0, **kwargs):
+    """
+    Chạy `func(crop, **kwargs)` trên từng ROI (mở rộng thêm `margin` pixel mỗi phía
+    để có ngữ cảnh, và tới ít nhất `min_size` pixel mỗi chiều nếu ảnh đủ lớn) rồi dán
+    phần bên trong ROI về ảnh kết quả. Vùng ngoài ROI giữ nguyên ảnh gốc (chuyển sang
+    ảnh xám nếu func trả về ảnh xám).
+    Với `batch=True`, `img` là stack (N, H, W) và ROI áp dụng cho mọi ảnh trong stack.
+    """
+    batch = kwargs.get("batch", False)
+    shape = img.shape[1:] if batch else img.shape
+    h, w = shape[:2]
+    result = None
+    for x, y, rw, rh in normalize_rois(rois, shape):
+        cx0, cx1 = _grow(max(0, x - margin), min(w, x + rw + margin), min_size, w)
+        cy0, cy1 = _grow(max(0, y - margin), min(h, y + rh + margin), min_size, h)
+        out = np.asarray(func(_window(img, slice(cy0, cy1), slice(cx0, cx1), batch), **kwargs))
+        if result is None:
+            result = _paste_base(img, out)
+        inner = _window(out, slice(y - cy0, y - cy0 + rh), slice(x - cx0, x - cx0 + rw), batch)
+        _window(result, slice(y, y + rh), slice(x, x + rw), batch)[...] = inner
+    return img.copy() if result is None else result
+
+
+def roi_aware(margin=0, min_size=0):
+    """
+    Decorator thêm tham số `rois` (và `roi_margin`) cho hàm xử lý ảnh.
+    `margin` mặc định nên bằng bán kính lân cận lớn nhất mà hàm sử dụng; `min_size` là
+    cạnh nhỏ nhất của vùng cắt mà hàm xử lý được (ví dụ số tile của CLAHE).
+    Cả hai có thể là hàm nhận dict tham số của lần gọi (đã điền giá trị mặc định),
+    ví dụ `margin=lambda p: p["window_size"] // 2`.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def resolve(value, img, args, kwargs):
+            if not callable(value):
+                return value
+            bound = signature.bind(img, *args, **kwargs)
+            bound.apply_defaults()
+            return value(bound.arguments)
+
+        @functools.wraps(func)
+        def wrapper(img, *args, rois=None, roi_margin=None, **kwargs):
+            if rois is None:
+                return func(img, *args, **kwargs)
+            if kwargs.get("return_lut"):
+                raise ValueError("return_lut không dùng được cùng rois (mỗi ROI có LUT riêng)")
+            def run(crop, **kw):
+                return func(crop, *args, **kw)
+            crop_margin = resolve(margin, img, args, kwargs) if roi_margin is None else roi_margin
+            return process_rois(run, img, rois, crop_margin,
+                                min_size=resolve(min_size, img, args, kwargs), **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,194 @@
+"""
+Cân bằng toàn cục cho một tập ảnh chia tile (ví dụ cảnh vệ tinh gồm nhiều tile).
+
+Xử lý từng tile riêng (hist_equalization, kéo giãn percentile của enhance_satellite_image)
+cho mỗi tile một LUT khác nhau -> đường nối và độ sáng không đồng đều giữa các tile kề nhau.
+Ở đây dùng hai lượt, bộ nhớ không phụ thuộc số tile:
+
+1. Cộng dồn histogram 256 bin theo từng kênh trên mọi tile (mỗi lúc chỉ giữ một tile)
+2. Tạo một LUT cho mỗi kênh (equalize / stretch / match), áp dụng song song cho từng tile
+
+    luts = equalize_tiles(paths, method="stretch", sink=lambda i, src, out: save(out, src))
+
+Chạy trên thư mục tile:
+    python -m processing.tiles tiles/ out/ --method equalize
+    python -m processing.tiles tiles/ out/ --profile sample   # + flame graph trong profiles/
+"""
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import backends
+from .histogram import equalization_lut
+from .intensity import _piecewise_lut
+
+METHODS = ("equalize", "stretch", "match")
+
+
+def load_tile(source):
+    """Tile từ đường dẫn file hoặc mảng numpy"""
+    if isinstance(source, str):
+        from PIL import Image
+        with Image.open(source) as image:
+            return np.array(image)
+    return np.asarray(source)
+
+
+def _channels(tile):
+    return [tile] if tile.ndim == 2 else [tile[..., c] for c in range(tile.shape[2])]
+
+
+def accumulate_histograms(sources, load=load_tile):
+    """
+    Lượt 1: histogram 256 bin của từng kênh, cộng dồn trên mọi tile.
+    Trả về mảng (số kênh, 256).
+    """
+    total = None
+    for source in sources:
+        tile = load(source)
+        if tile.dtype != np.uint8:
+            raise ValueError("Tile phải có kiểu dữ liệu uint8")
+        hists = np.stack([backends.histogram(ch) for ch in _channels(tile)]).astype(np.int64)
+        if total is None:
+            total = hists
+        elif total.shape != hists.shape:
+            raise ValueError("Các tile phải có cùng số kênh")
+        else:
+            total += hists
+    if total is None:
+        raise ValueError("Không có tile nào")
+    return total
+
+
+def percentile_from_histogram(hist, q):
+    """Mức xám nhỏ nhất mà tỉ lệ pixel <= nó đạt q% (percentile tính từ histogram)"""
+    cdf = np.cumsum(hist)
+    return int(np.searchsorted(cdf, cdf[-1] * q / 100.0))
+
+
+def matching_lut(hist, reference_hist):
+    """LUT đưa phân bố `hist` về phân bố `reference_hist` (histogram matching)"""
+    cdf = np.cumsum(hist) / max(np.sum(hist), 1)
+    ref_cdf = np.cumsum(reference_hist) / max(np.sum(reference_hist), 1)
+    return np.clip(np.searchsorted(ref_cdf, cdf), 0, 255).astype(np.uint8)
+
+
+def build_luts(hists, method="equalize", low=2, high=98, out_low=10, out_high=245, reference=None):
+    """
+    Một LUT cho mỗi kênh từ histogram toàn cục.
+
+    Args:
+        method: "equalize" - như hist_equalization
+                "stretch"  - kéo giãn [percentile low, high] -> [out_low, out_high]
+                             (như bước cuối của enhance_satellite_image)
+                "match"    - histogram matching về `reference` (mảng (số kênh, 256) hoặc (256,))
+    """
+    if method not in METHODS:
+        raise ValueError(f"method phải là một trong {METHODS}")
+    if method == "match":
+        if reference is None:
+            raise ValueError("method='match' cần histogram tham chiếu `reference`")
+        reference = np.atleast_2d(reference)
+    luts = []
+    for c, hist in enumerate(hists):
+        if method == "equalize":
+            luts.append(equalization_lut(hist))
+        elif method == "stretch":
+            r1 = percentile_from_histogram(hist, low)
+            r2 = percentile_from_histogram(hist, high)
+            luts.append(_piecewise_lut(r1, out_low, r2, out_high))
+        else:
+            luts.append(matching_lut(hist, reference[min(c, len(reference) - 1)]))
+    return np.stack(luts)
+
+
+def apply_luts(tile, luts):
+    """Áp dụng LUT của từng kênh cho một tile"""
+    if tile.ndim == 2:
+        return backends.lut_apply(tile, luts[0])
+    return np.stack([backends.lut_apply(ch, lut) for ch, lut in zip(_channels(tile), luts)], axis=2)
+
+
+def map_tiles(sources, luts, load=load_tile, max_workers=4):
+    """
+    Lượt 2: áp dụng LUT song song (thread pool), trả về (index, source, kết quả) theo thứ tự.
+    Số tile đang xử lý tối đa 2 x max_workers để bộ nhớ không tăng theo số tile.
+    """
+    from utils.profiling import worker_thread_prefix
+
+    def work(source):
+        return apply_luts(load(source), luts)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=worker_thread_prefix()) as pool:
+        pending = deque()
+        for index, source in enumerate(sources):
+            pending.append((index, source, pool.submit(work, source)))
+            if len(pending) >= 2 * max_workers:
+                i, src, future = pending.popleft()
+                yield i, src, future.result()
+        while pending:
+            i, src, future = pending.popleft()
+            yield i, src, future.result()
+
+
+def equalize_tiles(sources, method="equalize", sink=None, load=load_tile, max_workers=4, **lut_params):
+    """
+    Cân bằng toàn cục cho tập tile: histogram chung -> LUT chung -> áp dụng cho từng tile.
+
+    Args:
+        sources: danh sách đường dẫn / mảng (được duyệt hai lần)
+        sink: hàm sink(index, source, kết quả) nhận từng tile đã xử lý
+        lut_params: tham số của build_luts (low, high, out_low, out_high, reference)
+    Returns:
+        Mảng LUT (số kênh, 256) đã dùng
+    """
+    luts = build_luts(accumulate_histograms(sources, load), method, **lut_params)
+    for index, source, result in map_tiles(sources, luts, load, max_workers):
+        if sink is not None:
+            sink(index, source, result)
+    return luts
+
+
+def main(argv=None):
+    from PIL import Image
+    from utils.profiling import MODES, profiled
+    from utils.thumbnails import list_images
+
+    parser = argparse.ArgumentParser(description="Cân bằng toàn cục cho thư mục tile")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--method", choices=METHODS, default="equalize")
+    parser.add_argument("--reference", default=None, help="ảnh tham chiếu cho method=match")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--profile", choices=MODES, default=None,
+                        help="chạy dưới profiler, in các hàm nóng nhất và xuất file vào --profile-out")
+    parser.add_argument("--profile-out", default="profiles")
+    args = parser.parse_args(argv)
+    # Calibration backend (nếu máy chưa có cache) trước khi bắt đầu đo / nhận job
+    backends.warm_up()
+
+    paths = list_images(args.input_dir)
+    os.makedirs(args.output_dir, exist_ok=True)
+    lut_params = {}
+    if args.method == "match":
+        if args.reference is None:
+            parser.error("--method match cần --reference")
+        lut_params["reference"] = accumulate_histograms([args.reference])
+
+    def save(index, source, result):
+        name = os.path.splitext(os.path.basename(source))[0] + ".png"
+        Image.fromarray(result).save(os.path.join(args.output_dir, name))
+
+    with profiled(args.profile) as report:
+        equalize_tiles(paths, args.method, save, max_workers=args.workers, **lut_params)
+    print(f"Đã xử lý {len(paths)} tile -> {args.output_dir}")
+    if report is not None:
+        print(report.format_table())
+        print("Profile:", ", ".join(report.write(args.profile_out, f"tiles_{args.method}")))
+
+
+if __name__ == "__main__":
+    main()
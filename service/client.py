@@ -0,0 +1,75 @@
+"""
+Client HTTP cho job server (chỉ dùng thư viện chuẩn).
+"""
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+
+from service.job_server import DONE, ERROR, array_to_bytes, bytes_to_array, image_hash
+
+DEFAULT_URL = os.environ.get("JOB_SERVER_URL", "http://127.0.0.1:8765")
+
+
+class JobError(RuntimeError):
+    pass
+
+
+class JobClient:
+    def __init__(self, base_url=DEFAULT_URL, timeout=10.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, method, path, data=None, content_type="application/json"):
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header("Content-Type", content_type)
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return resp.read()
+
+    def available(self):
+        """Kiểm tra server có đang chạy hay không"""
+        try:
+            self._request("GET", "/health")
+            return True
+        except (urllib.error.URLError, OSError):
+            return False
+
+    def upload_image(self, img, img_hash=None):
+        """Upload ảnh (bỏ qua nếu server đã có), trả về hash (server kiểm tra hash = image_hash(img))"""
+        img_hash = img_hash or image_hash(img)
+        try:
+            self._request("HEAD", f"/images/{img_hash}")
+        except urllib.error.HTTPError:
+            self._request("PUT", f"/images/{img_hash}", array_to_bytes(img),
+                          "application/octet-stream")
+        return img_hash
+
+    def submit(self, img_hash, pipeline, params=None):
+        body = json.dumps({"image": img_hash, "pipeline": pipeline, "params": params or {}})
+        return json.loads(self._request("POST", "/jobs", body.encode()))
+
+    def status(self, job_id):
+        return json.loads(self._request("GET", f"/jobs/{job_id}"))
+
+    def result(self, job_id):
+        return bytes_to_array(self._request("GET", f"/jobs/{job_id}/result"))
+
+    def run(self, img, pipeline, params=None, poll_interval=0.1, on_progress=None):
+        """
+        Upload ảnh, gửi job rồi poll đến khi xong.
+        `on_progress(status)` được gọi mỗi lần poll (dùng cho progress bar).
+        """
+        img_hash = self.upload_image(img)
+        status = self.submit(img_hash, pipeline, params)
+        while status["state"] not in (DONE, ERROR):
+            if on_progress is not None:
+                on_progress(status)
+            time.sleep(poll_interval)
+            status = self.status(status["id"])
+        if on_progress is not None:
+            on_progress(status)
+        if status["state"] == ERROR:
+            raise JobError(status["error"])
+        return self.result(status["id"])
@@ -0,0 +1,451 @@
+"""
+Job server cục bộ cho các tác vụ xử lý ảnh nặng.
+
+- Worker là một process pool, mỗi job = (hash ảnh, pipeline, params).
+- Các job giống hệt nhau đang chạy được gộp lại (single-flight): chỉ tính một lần.
+- Giao tiếp qua HTTP trên localhost, chỉ dùng thư viện chuẩn.
+- Ảnh vào/ra worker đi qua shared memory (xem `service.shm`), chỉ handle
+  nhỏ được pickle; đặt `transport="pickle"` để quay về cách truyền cũ.
+
+Chạy server:
+    python -m service.job_server --port 8765 --workers 2
+    python -m service.job_server --profile sample --profile-out profiles   # profile từng job
+
+Endpoints:
+    PUT  /images/<hash>       body: ảnh dạng .npy; <hash> phải là image_hash của ảnh (sai -> 400)
+    POST /jobs                body: {"image": hash, "pipeline": tên, "params": {...}}
+    GET  /jobs/<id>           trạng thái job (JSON)
+    GET  /jobs/<id>/result    kết quả dạng .npy
+    GET  /health
+
+"progress" trong trạng thái job chỉ là mốc thô: 0 khi đang chờ, 0.1 khi worker bắt đầu
+chạy pipeline, 1.0 khi xong - các pipeline không báo tiến độ từ bên trong.
+"""
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing as mp
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from processing import planner
+from service.pipelines import PIPELINES, run_pipeline
+from service.shm import SharedImage, attach, ensure_tracker, share_result
+from utils.profiling import MODES, profiled
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+
+# Hàng đợi tiến độ dùng chung trong tiến trình worker (gán bởi initializer)
+_progress_queue = None
+# Profiling từng job trong worker: (mode của utils.profiling, thư mục xuất) hoặc None
+_profile = None
+
+
+def _init_worker(progress_queue, profile=None):
+    global _progress_queue, _profile
+    _progress_queue = progress_queue
+    _profile = profile
+
+
+def _report_progress(job_id, progress):
+    if _progress_queue is not None:
+        _progress_queue.put((job_id, progress))
+
+
+def _profiled_pipeline(job_id, pipeline, params, img):
+    """run_pipeline; khi server chạy với --profile thì ghi profile của job vào thư mục xuất"""
+    if _profile is None:
+        return run_pipeline(pipeline, img, params)
+    mode, directory = _profile
+    with profiled(mode) as report:
+        result = run_pipeline(pipeline, img, params)
+    report.write(directory, f"{pipeline}_{job_id}")
+    return result
+
+
+def _run_job(job_id, pipeline, params, img):
+    """Hàm chạy trong tiến trình worker"""
+    _report_progress(job_id, 0.1)
+    result = _profiled_pipeline(job_id, pipeline, params, img)
+    _report_progress(job_id, 1.0)
+    return np.asarray(result)
+
+
+def _run_job_shm(job_id, pipeline, params, handle):
+    """Như `_run_job` nhưng đọc ảnh vào và ghi kết quả qua shared memory"""
+    _report_progress(job_id, 0.1)
+    with attach(handle) as img:
+        result = _profiled_pipeline(job_id, pipeline, params, img)
+        out_handle = share_result(result)
+    _report_progress(job_id, 1.0)
+    return out_handle
+
+
+def image_hash(img):
+    """Hash nội dung ảnh (kể cả shape và dtype) để làm khóa job"""
+    h = hashlib.md5(img.tobytes())
+    h.update(f"{img.shape}|{img.dtype}".encode())
+    return h.hexdigest()
+
+
+def job_key(img_hash, pipeline, params):
+    """Khóa xác định duy nhất một job, dùng cho việc gộp job trùng"""
+    payload = json.dumps([img_hash, pipeline, params or {}], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def array_to_bytes(arr):
+    buf = io.BytesIO()
+    np.save(buf, arr, allow_pickle=False)
+    return buf.getvalue()
+
+
+def bytes_to_array(data):
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+class Job:
+    def __init__(self, job_id, img_hash, pipeline, params):
+        self.id = job_id
+        self.image = img_hash
+        self.pipeline = pipeline
+        self.params = params
+        self.state = QUEUED
+        self.progress = 0.0
+        self.error = None
+        self.result = None
+        self.input = None  # ảnh đầu vào đang được job giữ (xem JobManager._pin)
+        self.submitted = time.time()
+        self.finished = None
+
+    def status(self):
+        end = self.finished or time.time()
+        return {
+            "id": self.id,
+            "pipeline": self.pipeline,
+            "state": self.state,
+            "progress": self.progress,
+            "error": self.error,
+            "elapsed": round(end - self.submitted, 3),
+        }
+
+
+class JobManager:
+    """
+    Quản lý ảnh, job và process pool. Có thể dùng trực tiếp trong Python
+    hoặc thông qua HTTP server bên dưới.
+    """
+
+    def __init__(self, workers=None, max_images=16, max_results=32, transport="shm", profile=None,
+                 profile_dir="profiles"):
+        if transport not in ("shm", "pickle"):
+            raise ValueError(f"transport không hợp lệ: {transport}")
+        self.transport = transport
+        self._lock = threading.Lock()
+        self._images = OrderedDict()
+        # id(ảnh) -> [ảnh, số job đang chờ/chạy giữ ảnh, đã bị bỏ khỏi _images chưa]
+        self._pins = {}
+        self._jobs = OrderedDict()
+        self._max_images = max_images
+        self._max_results = max_results
+        self._progress_queue = mp.Queue()
+        if transport == "shm":
+            ensure_tracker()
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers or max(1, (os.cpu_count() or 2) - 1),
+            initializer=_init_worker,
+            initargs=(self._progress_queue, (profile, profile_dir) if profile else None),
+        )
+        self._closed = False
+        self._progress_thread = threading.Thread(target=self._drain_progress, daemon=True)
+        self._progress_thread.start()
+
+    # --- Ảnh ---
+    def put_image(self, img, img_hash=None):
+        """
+        Lưu ảnh với khóa `img_hash`. PUT lại cùng hash (cùng nội dung) giữ nguyên bản
+        đã có - các job đang chờ/chạy có thể đang đọc segment đó.
+        """
+        img_hash = img_hash or image_hash(img)
+        with self._lock:
+            if img_hash in self._images:
+                self._images.move_to_end(img_hash)
+                return img_hash
+        if self.transport == "shm":
+            img = SharedImage.from_array(img)
+        with self._lock:
+            if img_hash in self._images:
+                # Một PUT song song cùng hash đã lưu trước: bỏ bản vừa tạo
+                self._images.move_to_end(img_hash)
+                evicted = [img]
+            else:
+                self._images[img_hash] = img
+                evicted = []
+                while len(self._images) > self._max_images:
+                    evicted += self._retire(self._images.popitem(last=False)[1])
+        for item in evicted:
+            _release(item)
+        return img_hash
+
+    def has_image(self, img_hash):
+        with self._lock:
+            return img_hash in self._images
+
+    # --- Job ---
+    def submit(self, img_hash, pipeline, params=None):
+        """
+        Gửi job. Nếu job giống hệt đang chạy hoặc đã xong thì trả lại job cũ.
+        """
+        if pipeline not in PIPELINES:
+            raise ValueError(f"Pipeline không tồn tại: {pipeline}")
+        params = params or {}
+        job_id = job_key(img_hash, pipeline, params)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.state != ERROR:
+                self._jobs.move_to_end(job_id)
+                return job_id
+            img = self._images.get(img_hash)
+            if img is None:
+                raise KeyError(f"Chưa có ảnh với hash {img_hash}")
+            job = Job(job_id, img_hash, pipeline, params)
+            # Giữ ảnh tới khi job kết thúc: bị đẩy khỏi _images thì chưa giải phóng ngay
+            job.input = self._pin(img)
+            self._jobs[job_id] = job
+            self._evict_results()
+        try:
+            if isinstance(img, SharedImage):
+                future = self._pool.submit(_run_job_shm, job_id, pipeline, params, img.handle)
+            else:
+                future = self._pool.submit(_run_job, job_id, pipeline, params, img)
+        except Exception:
+            with self._lock:
+                released = self._unpin(job)
+            for item in released:
+                _release(item)
+            raise
+        future.add_done_callback(lambda f, job=job: self._on_done(job, f))
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else job.status()
+
+    def result(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.result is None:
+                return None
+            return job.result.array if isinstance(job.result, SharedImage) else job.result
+
+    def wait(self, job_id, timeout=None, poll_interval=0.05):
+        """Chờ job kết thúc, trả về trạng thái cuối"""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            status = self.status(job_id)
+            if status is None or status["state"] in (DONE, ERROR):
+                return status
+            if deadline is not None and time.time() > deadline:
+                return status
+            time.sleep(poll_interval)
+
+    def shutdown(self):
+        self._closed = True
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._progress_queue.put(None)
+        self._progress_thread.join(timeout=1)
+        with self._lock:
+            items = list(self._images.values())
+            items += [job.result for job in self._jobs.values()]
+            self._images.clear()
+            self._jobs.clear()
+        for item in items:
+            _release(item)
+
+    # --- Nội bộ ---
+    def _on_done(self, job, future):
+        with self._lock:
+            job.finished = time.time()
+            released = self._unpin(job)
+            try:
+                result = future.result()
+                if self.transport == "shm":
+                    result = SharedImage.adopt(result)
+                if self._closed:
+                    released.append(result)
+                else:
+                    job.result = result
+                    job.state = DONE
+                    job.progress = 1.0
+            except Exception as e:
+                job.state = ERROR
+                job.error = str(e)
+        for item in released:
+            _release(item)
+
+    def _pin(self, img):
+        # Gọi khi giữ lock: thêm một job giữ ảnh
+        entry = self._pins.setdefault(id(img), [img, 0, False])
+        entry[1] += 1
+        return img
+
+    def _unpin(self, job):
+        # Gọi khi giữ lock: job thôi giữ ảnh; trả về ảnh cần giải phóng (đã bị bỏ và hết job giữ)
+        img, job.input = job.input, None
+        entry = self._pins.get(id(img))
+        if entry is None:
+            return []
+        entry[1] -= 1
+        if entry[1] > 0:
+            return []
+        del self._pins[id(img)]
+        return [img] if entry[2] else []
+
+    def _retire(self, img):
+        # Gọi khi giữ lock: ảnh bị bỏ khỏi _images; trả về [img] nếu giải phóng được ngay
+        entry = self._pins.get(id(img))
+        if entry is None:
+            return [img]
+        entry[2] = True
+        return []
+
+    def _drain_progress(self):
+        while True:
+            item = self._progress_queue.get()
+            if item is None:
+                return
+            job_id, progress = item
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None and job.state == QUEUED:
+                    job.state = RUNNING
+                if job is not None and job.state == RUNNING:
+                    job.progress = max(job.progress, progress)
+
+    def _evict_results(self):
+        # Chỉ loại bỏ job đã kết thúc, giữ lại job đang chạy
+        finished = [k for k, j in self._jobs.items() if j.state in (DONE, ERROR)]
+        while len(self._jobs) > self._max_results and finished:
+            _release(self._jobs.pop(finished.pop(0)).result)
+
+
+def _release(item):
+    """Giải phóng segment shared memory (nếu có)"""
+    if isinstance(item, SharedImage):
+        item.unlink()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    manager = None  # gán bởi make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, body=b"", content_type="application/json"):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, code, obj):
+        self._send(code, json.dumps(obj).encode())
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts == ["health"]:
+            return self._send_json(200, {"ok": True, "pipelines": sorted(PIPELINES)})
+        if len(parts) >= 2 and parts[0] == "jobs":
+            status = self.manager.status(parts[1])
+            if status is None:
+                return self._send_json(404, {"error": "job not found"})
+            if len(parts) == 2:
+                return self._send_json(200, status)
+            if parts[2:] == ["result"]:
+                if status["state"] != DONE:
+                    return self._send_json(409, status)
+                body = array_to_bytes(self.manager.result(parts[1]))
+                return self._send(200, body, "application/octet-stream")
+        self._send_json(404, {"error": "not found"})
+
+    def do_HEAD(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "images":
+            return self._send(200 if self.manager.has_image(parts[1]) else 404)
+        self._send(404)
+
+    def do_PUT(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "images":
+            return self._send_json(404, {"error": "not found"})
+        try:
+            img = bytes_to_array(self._read_body())
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        # Hash là khóa nội dung (gộp job, kết quả cache): không nhận ảnh sai hash
+        if image_hash(img) != parts[1]:
+            return self._send_json(400, {"error": "hash không khớp với nội dung ảnh"})
+        img_hash = self.manager.put_image(img, parts[1])
+        self._send_json(200, {"image": img_hash})
+
+    def do_POST(self):
+        if self.path.strip("/") != "jobs":
+            return self._send_json(404, {"error": "not found"})
+        try:
+            payload = json.loads(self._read_body())
+            job_id = self.manager.submit(payload["image"], payload["pipeline"], payload.get("params"))
+        except KeyError as e:
+            return self._send_json(404, {"error": str(e)})
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        self._send_json(202, self.manager.status(job_id))
+
+
+def make_server(manager, host="127.0.0.1", port=8765):
+    handler = type("JobHandler", (_Handler,), {"manager": manager})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Job server xử lý ảnh cục bộ")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--transport", choices=["shm", "pickle"], default="shm")
+    parser.add_argument("--profile", choices=MODES, default=None,
+                        help="profile từng job, ghi collapsed stack / flame graph / .prof vào --profile-out")
+    parser.add_argument("--profile-out", default="profiles")
+    args = parser.parse_args(argv)
+    # Calibration backend + cost model planner (nếu máy chưa có cache) trước khi bắt đầu đo / nhận job
+    planner.warm_up()
+
+    manager = JobManager(workers=args.workers, transport=args.transport, profile=args.profile,
+                         profile_dir=args.profile_out)
+    server = make_server(manager, args.host, args.port)
+    print(f"Job server đang chạy tại http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Danh sách các pipeline xử lý mà job server có thể chạy.
+
+Mỗi pipeline được khai báo bằng chuỗi "module:hàm" và chỉ import khi được gọi,
+để tiến trình worker không phải nạp toàn bộ `processing` khi khởi động.
+"""
+import importlib
+
+# Tên pipeline -> (đường dẫn hàm, ảnh đầu vào phải là ảnh xám)
+PIPELINES = {
+    "negative": ("processing.intensity:negative", False),
+    "log": ("processing.intensity:log_transform", False),
+    "gamma": ("processing.intensity:gamma_correction", False),
+    "piecewise": ("processing.intensity:piecewise_linear", False),
+    "hist_equalization": ("processing.histogram:hist_equalization", True),
+    "ahe": ("processing.histogram:ahe_equalization_fast", True),
+    "ahe_exact": ("processing.histogram:ahe_equalization", True),
+    "clahe": ("processing.histogram:clahe_equalization", True),
+    "license_plate": ("processing.applications:enhance_license_plate", False),
+    "satellite": ("processing.applications:enhance_satellite_image", False),
+    "low_light": ("processing.applications:enhance_low_light_image", False),
+    "document": ("processing.applications:enhance_document", False),
+}
+
+
+def _resolve(path):
+    module_name, func_name = path.split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def to_gray(img):
+    """Chuyển ảnh màu sang ảnh xám uint8 (giống công thức trong app)"""
+    from processing import backends
+    if img.ndim == 3:
+        return backends.rgb_to_gray(img)
+    return img
+
+
+def run_pipeline(name, img, params=None):
+    """
+    Chạy pipeline `name` trên ảnh `img` với các tham số keyword `params`.
+    """
+    if name not in PIPELINES:
+        raise ValueError(f"Pipeline không tồn tại: {name}")
+    path, needs_gray = PIPELINES[name]
+    func = _resolve(path)
+    if needs_gray:
+        img = to_gray(img)
+    return func(img, **(params or {}))
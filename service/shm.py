@@ -0,0 +1,117 @@
+"""
+Truyền ảnh giữa các tiến trình qua shared memory (không pickle dữ liệu ảnh).
+
+- `ShmHandle`: handle nhỏ (tên segment, shape, dtype) - chỉ handle này được pickle.
+- `SharedImage`: sở hữu một segment, chịu trách nhiệm close/unlink.
+- `attach(handle)`: mở segment có sẵn trong tiến trình worker (không sở hữu).
+"""
+from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+ShmHandle = namedtuple("ShmHandle", ["name", "shape", "dtype"])
+
+
+def ensure_tracker():
+    """
+    Khởi động resource tracker trước khi tạo process pool để worker dùng chung
+    tracker với tiến trình cha. Nếu không, worker tự tạo tracker riêng và sẽ
+    unlink các segment kết quả khi worker kết thúc.
+    """
+    resource_tracker.ensure_running()
+
+
+class SharedImage:
+    """
+    Mảng numpy nằm trong shared memory. Tiến trình tạo ra (owner) phải gọi
+    `unlink()` (hoặc dùng `with`) khi không cần nữa.
+    """
+
+    def __init__(self, shm, shape, dtype, owner=True):
+        self._shm = shm
+        self.owner = owner
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @classmethod
+    def empty(cls, shape, dtype=np.uint8):
+        dtype = np.dtype(dtype)
+        nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        return cls(shm, tuple(shape), dtype)
+
+    @classmethod
+    def from_array(cls, arr):
+        """Cấp phát segment mới và copy `arr` vào (copy duy nhất)"""
+        arr = np.asarray(arr)
+        shared = cls.empty(arr.shape, arr.dtype)
+        shared.array[...] = arr
+        return shared
+
+    @classmethod
+    def adopt(cls, handle):
+        """Nhận quyền sở hữu segment do tiến trình khác tạo ra"""
+        shm = shared_memory.SharedMemory(name=handle.name)
+        return cls(shm, handle.shape, handle.dtype)
+
+    @property
+    def handle(self):
+        return ShmHandle(self._shm.name, self.array.shape, self.array.dtype.str)
+
+    @property
+    def nbytes(self):
+        return self.array.nbytes
+
+    def close(self):
+        # Chỉ đóng được khi không còn view nào tham chiếu tới buffer
+        self.array = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
+
+    def unlink(self):
+        self.close()
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+            self.owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
+
+
+@contextmanager
+def attach(handle):
+    """
+    Mở segment theo handle và trả về mảng numpy dùng chung (không copy).
+    Segment được close khi thoát khỏi `with`, nhưng không bị unlink.
+    """
+    shm = shared_memory.SharedMemory(name=handle.name)
+    arr = np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=shm.buf)
+    try:
+        yield arr
+    finally:
+        del arr
+        shm.close()
+
+
+def share_result(result):
+    """
+    Dùng trong worker: ghi kết quả vào segment mới, trả về handle cho tiến trình
+    cha (tiến trình cha gọi `SharedImage.adopt` để nhận quyền sở hữu).
+
+    Worker và tiến trình cha dùng chung một resource tracker (xem
+    `ensure_tracker`) nên segment vẫn được dọn nếu tiến trình cha chết đột ngột.
+    """
+    shared = SharedImage.from_array(np.ascontiguousarray(result))
+    handle = shared.handle
+    shared.owner = False
+    shared.close()
+    return handle
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from processing.intensity import gamma_correction
+
+
+def _image(dtype):
+    return np.arange(256, dtype=np.uint8).reshape(16, 16).astype(dtype)
+
+
+def test_gamma_correction_uint8_returns_lut():
+    img = _image(np.uint8)
+    out, lut = gamma_correction(img, gamma=0.5, return_lut=True)
+    assert lut.shape == (256,) and lut.dtype == np.uint8
+    np.testing.assert_array_equal(out, lut[img])
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64, np.uint16])
+def test_gamma_correction_non_uint8_return_lut(dtype):
+    img = _image(dtype)
+    out, lut = gamma_correction(img, gamma=0.5, return_lut=True)
+    assert lut is None
+    np.testing.assert_array_equal(out, gamma_correction(img, gamma=0.5))
+    # Cùng công thức với nhánh uint8 (chỉ khác cách tính)
+    np.testing.assert_allclose(out.astype(int), gamma_correction(_image(np.uint8), gamma=0.5).astype(int), atol=1)
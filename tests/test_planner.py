@@ -0,0 +1,58 @@
+import threading
+
+import numpy as np
+import pytest
+
+from processing import planner
+from processing.planner import Plan, run_plan
+
+# Sai số cho phép giữa thời gian thực tế và dự đoán (máy đo thường nhiễu)
+TOLERANCE = 2.0
+
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    """Cost model đo mới trong thư mục cache tạm (không dùng cache có sẵn của máy)"""
+    mp = pytest.MonkeyPatch()
+    mp.setenv("TIEU_LUAN_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+    mp.setattr(planner, "_model", None)
+    yield planner.get_cost_model()
+    mp.undo()
+
+
+def _image(h, w):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (h, w), dtype=np.uint8)
+
+
+def _ratio(img, plan, repeat=5):
+    actual = [run_plan(img, plan)[1]["actual_s"] for _ in range(repeat)]
+    return float(np.median(actual)) / plan.predicted_s
+
+
+@pytest.mark.parametrize("algorithm, params, shape", [
+    ("ahe_fast", {"window_size": 64, "step_size": 6}, (128, 128)),
+    ("ahe_exact", {"window_size": 64}, (48, 64)),
+    ("threshold", {"max_pixels": None}, (128, 128)),
+])
+def test_prediction_error_on_small_image(model, algorithm, params, shape):
+    h, w = shape
+    if algorithm == "ahe_fast":
+        name, features = planner._ahe_fast_model(params["step_size"]), planner._ahe_fast_features(h, w)
+    elif algorithm == "ahe_exact":
+        name, features = "ahe_exact", planner._ahe_exact_features(h, w, params["window_size"])
+    else:
+        name, features = "threshold", planner._threshold_features(h, w)
+    plan = Plan(algorithm, params, planner._predict(model, name, features), 1)
+    ratio = _ratio(_image(h, w), plan)
+    assert 1 / TOLERANCE <= ratio <= TOLERANCE, f"{algorithm} {shape}: thực tế / dự đoán = {ratio:.2f}"
+
+
+def test_cost_model_calibrated_once_across_threads(model):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(planner.get_cost_model())) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(r is model for r in results)
@@ -0,0 +1,55 @@
+import json
+import os
+import platform
+import tempfile
+
+import numpy as np
+
+
+def cache_dir(subdir=""):
+    """
+    Thư mục cache trên đĩa (đổi bằng biến môi trường TIEU_LUAN_CACHE_DIR).
+    """
+    root = os.environ.get("TIEU_LUAN_CACHE_DIR",
+                          os.path.join(os.path.expanduser("~"), ".cache", "tieu_luan_1"))
+    path = os.path.join(root, subdir)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def host_signature():
+    """
+    Chuỗi nhận diện máy đang chạy - kết quả đo hiệu năng chỉ dùng lại trên cùng máy.
+    """
+    return "|".join([
+        platform.node(),
+        platform.machine(),
+        str(os.cpu_count()),
+        platform.python_version(),
+        np.__version__,
+    ])
+
+
+def load_json(name):
+    """Đọc file JSON trong cache, trả về None nếu chưa có hoặc bị hỏng"""
+    path = os.path.join(cache_dir(), name)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_json(name, data):
+    """Ghi file JSON vào cache (ghi file tạm rồi đổi tên để tránh file dở dang)"""
+    path = os.path.join(cache_dir(), name)
+    # File tạm riêng cho mỗi lần ghi (nhiều thread/tiến trình có thể ghi cùng lúc)
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
@@ -1,4 +1,6 @@
-from PIL import Image
+from io import BytesIO
+
+from PIL import Image, ImageMode
 import numpy as np
 
 def pil_to_np(image):
@@ -6,3 +8,59 @@ def pil_to_np(image):
 
 def np_to_pil(array):
     return Image.fromarray(array)
+
+def decoded_nbytes(image):
+    """
+    Số byte của mảng numpy sau khi giải mã (chỉ đọc header): theo kiểu dữ liệu của
+    mode - I;16 là 2 byte, I và F là 4 byte mỗi kênh
+    """
+    w, h = image.size
+    mode = ImageMode.getmode(image.mode)
+    return w * h * len(mode.bands) * np.dtype(mode.typestr).itemsize
+
+def _pyramid_level(image, max_bytes):
+    # Mức k nhỏ nhất để ảnh thu nhỏ 2^k mỗi chiều vừa max_bytes
+    k = 0
+    while decoded_nbytes(image) > max_bytes * 4 ** k and min(image.size) >> (k + 1) >= 16:
+        k += 1
+    return k
+
+def decode_peak_nbytes(data, max_bytes):
+    """
+    Bộ nhớ đỉnh (byte) của `decode_within(data, max_bytes)`, để dành chỗ trước khi giải mã:
+    buffer giải mã của PIL + buffer resize (nếu có) + 2 lần mảng kết quả (tobytes và
+    np.array). JPEG giải mã thẳng ở độ phân giải nhỏ (draft, tối đa 8 lần mỗi chiều);
+    PNG, TIFF... giải mã ở kích thước gốc rồi mới thu nhỏ.
+    """
+    image = Image.open(BytesIO(data))
+    full = decoded_nbytes(image)
+    # PIL lưu ảnh 3 kênh 8 bit với 4 byte mỗi pixel
+    pil_full = full * 4 // 3 if image.mode in ("RGB", "YCbCr", "LAB", "HSV") else full
+    k = _pyramid_level(image, max_bytes)
+    drafted = k if image.format == "JPEG" else 0
+    peak = pil_full // 4 ** min(drafted, 3) + 2 * (full // 4 ** k)
+    if k > min(drafted, 3):
+        peak += pil_full // 4 ** k
+    return peak
+
+def decode_within(data, max_bytes):
+    """
+    Giải mã ảnh sao cho mảng kết quả không vượt `max_bytes`.
+
+    Ảnh quá lớn được thu nhỏ về mức pyramid k nhỏ nhất vừa ngân sách (mỗi chiều
+    chia 2^k, như utils.pyramid). Chỉ JPEG hỗ trợ `draft` (decoder giảm độ phân giải
+    ngay khi giải mã, không giữ ảnh đầy đủ); PNG, TIFF... vẫn giải mã ở kích thước
+    gốc rồi mới thu nhỏ, nên bộ nhớ đỉnh là ảnh gốc - xem decode_peak_nbytes.
+
+    Returns:
+        (mảng numpy, k) - k = 0 nếu giữ nguyên độ phân giải
+    """
+    image = Image.open(BytesIO(data))
+    k = _pyramid_level(image, max_bytes)
+    if k == 0:
+        return pil_to_np(image), 0
+    target = (image.size[0] >> k, image.size[1] >> k)
+    image.draft(image.mode, target)
+    if image.size != target:
+        image = image.resize(target, Image.BOX)
+    return pil_to_np(image), k
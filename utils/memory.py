@@ -0,0 +1,219 @@
+"""
+Bộ điều phối bộ nhớ (memory governor) dùng chung cho cả tiến trình.
+
+Các cache (histogram, ảnh upload đã giải mã, mức pyramid, kết quả của từng session...)
+đăng ký số byte đang giữ với governor. Khi tổng vượt ngân sách, governor bỏ các mục
+ít được dùng gần đây nhất (LRU) - bất kể thuộc session nào - bằng callback của chủ sở hữu.
+Mọi mục được theo dõi đều tính lại được nên bỏ đi chỉ làm chậm lần truy cập sau.
+
+Ngân sách đặt bằng biến môi trường TIEU_LUAN_MEMORY_BUDGET_MB (mặc định 2048).
+
+    cache = GovernedCache("histogram", max_items=32)
+    cache["key"] = value          # đăng ký + có thể đẩy mục cũ ra
+    value = cache.get("key")      # None nếu chưa có hoặc đã bị bỏ
+    governor().usage()            # số liệu cho giám sát
+"""
+import os
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+
+DEFAULT_BUDGET_MB = 2048
+# Một ảnh upload không được chiếm quá phần này của ngân sách (xem upload_limit)
+UPLOAD_FRACTION = 0.25
+
+
+def sizeof(obj):
+    """Ước lượng số byte của một giá trị trong cache (mảng numpy, ảnh PIL, tuple/list/dict)"""
+    if obj is None:
+        return 0
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if hasattr(obj, "getbands") and hasattr(obj, "size"):  # PIL.Image
+        from .image_io import decoded_nbytes
+        return decoded_nbytes(obj)
+    if isinstance(obj, (tuple, list)):
+        return sum(sizeof(item) for item in obj)
+    if isinstance(obj, dict):
+        return sum(sizeof(item) for item in obj.values())
+    return sys.getsizeof(obj)
+
+
+class MemoryGovernor:
+    def __init__(self, budget_bytes):
+        self.budget = int(budget_bytes)
+        self._entries = OrderedDict()  # (owner, key) -> (nbytes, on_evict), cũ nhất ở đầu
+        self._used = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def track(self, owner, key, nbytes, on_evict):
+        """
+        Ghi nhận mục (owner, key) giữ `nbytes` byte. Nếu vượt ngân sách, các mục cũ nhất
+        (kể cả của owner khác) bị bỏ: governor gọi `on_evict()` của chúng.
+        """
+        with self._lock:
+            old = self._entries.pop((owner, key), None)
+            if old is not None:
+                self._used -= old[0]
+            self._entries[(owner, key)] = (int(nbytes), on_evict)
+            self._used += int(nbytes)
+            victims = self._collect_victims(keep=(owner, key))
+        self._evict(victims)
+
+    def touch(self, owner, key):
+        """Đánh dấu mục vừa được dùng (chuyển về cuối hàng LRU)"""
+        with self._lock:
+            if (owner, key) in self._entries:
+                self._entries.move_to_end((owner, key))
+
+    def forget(self, owner, key):
+        """Chủ sở hữu tự bỏ mục (không gọi on_evict)"""
+        with self._lock:
+            entry = self._entries.pop((owner, key), None)
+            if entry is not None:
+                self._used -= entry[0]
+
+    def forget_owner(self, owner):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == owner]:
+                self._used -= self._entries.pop(entry_key)[0]
+
+    def reserve(self, nbytes):
+        """Bỏ các mục cũ cho tới khi còn chỗ cho `nbytes` byte (ví dụ trước khi giải mã ảnh lớn)"""
+        with self._lock:
+            victims = self._collect_victims(extra=nbytes)
+        self._evict(victims)
+
+    def available(self):
+        with self._lock:
+            return max(0, self.budget - self._used)
+
+    def upload_limit(self):
+        """Số byte tối đa cho một ảnh upload đã giải mã"""
+        return int(self.budget * UPLOAD_FRACTION)
+
+    def usage(self):
+        """Số liệu hiện tại: tổng, ngân sách, số mục, số lần bỏ và byte theo từng nhóm owner"""
+        with self._lock:
+            groups = {}
+            for (owner, _), (nbytes, _) in self._entries.items():
+                group = str(owner).split(":", 1)[0]
+                groups[group] = groups.get(group, 0) + nbytes
+            return {
+                "budget_bytes": self.budget,
+                "used_bytes": self._used,
+                "entries": len(self._entries),
+                "evictions": self._evictions,
+                "by_group": groups,
+            }
+
+    def _collect_victims(self, keep=None, extra=0):
+        # Gọi khi đang giữ lock: lấy các mục cũ nhất ra cho tới khi vừa ngân sách
+        victims = []
+        for entry_key in list(self._entries):
+            if self._used + extra <= self.budget:
+                break
+            if entry_key == keep:
+                continue
+            nbytes, on_evict = self._entries.pop(entry_key)
+            self._used -= nbytes
+            self._evictions += 1
+            victims.append(on_evict)
+        return victims
+
+    @staticmethod
+    def _evict(victims):
+        # Callback chạy ngoài lock (có thể gọi lại forget/track)
+        for on_evict in victims:
+            on_evict()
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def governor():
+    """Governor dùng chung cho cả tiến trình"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            budget_mb = float(os.environ.get("TIEU_LUAN_MEMORY_BUDGET_MB", DEFAULT_BUDGET_MB))
+            _governor = MemoryGovernor(budget_mb * 1024 * 1024)
+        return _governor
+
+
+def weak_callback(obj, method, *args):
+    """
+    Callback on_evict gọi obj.method(*args) mà không giữ `obj` sống - dùng khi một đối
+    tượng tự đăng ký dữ liệu của nó với governor().track (GovernedCache, ImagePyramid)
+    """
+    ref = weakref.ref(obj)
+
+    def on_evict():
+        target = ref()
+        if target is not None:
+            getattr(target, method)(*args)
+    return on_evict
+
+
+class GovernedCache:
+    """
+    Cache LRU có đăng ký với governor: bị giới hạn bởi `max_items` (nếu có) và bởi
+    ngân sách byte chung của tiến trình. Khi cache bị thu hồi (ví dụ session kết thúc),
+    các mục của nó được xóa khỏi governor.
+    """
+
+    def __init__(self, owner, max_items=None):
+        self.owner = owner
+        self.max_items = max_items
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        weakref.finalize(self, governor().forget_owner, owner)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            value = self._data[key]
+        governor().touch(self.owner, key)
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            dropped = []
+            while self.max_items and len(self._data) > self.max_items:
+                dropped.append(self._data.popitem(last=False)[0])
+        for old_key in dropped:
+            governor().forget(self.owner, old_key)
+        # Callback chỉ giữ weakref: governor không giữ cache (và dữ liệu của nó) sống
+        governor().track(self.owner, key, sizeof(value), weak_callback(self, "_drop", key))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            value = self._data.pop(key, default)
+        governor().forget(self.owner, key)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        governor().forget_owner(self.owner)
+
+    def _drop(self, key):
+        # Governor bỏ mục này để giải phóng bộ nhớ
+        with self._lock:
+            self._data.pop(key, None)
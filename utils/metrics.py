@@ -34,3 +34,19 @@ def compute_psnr(a: np.ndarray, b: np.ndarray, max_val: float = 255.0) -> float:
     if mse == 0:
         return float('inf')
     return 20.0 * float(np.log10(max_val)) - 10.0 * float(np.log10(mse))
+
+def compute_pixel_agreement(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Tỉ lệ pixel giống nhau (dùng cho ảnh nhị phân / mask), trong [0, 1].
+    """
+    a, b = _ensure_same_shape(a, b)
+    return float(np.mean(a == b))
+
+def compute_histogram_distance(hist_a: np.ndarray, hist_b: np.ndarray) -> float:
+    """
+    Khoảng cách total variation giữa hai histogram (đã chuẩn hóa), trong [0, 1].
+    0 = phân bố giống hệt nhau.
+    """
+    pa = hist_a / max(hist_a.sum(), 1)
+    pb = hist_b / max(hist_b.sum(), 1)
+    return 0.5 * float(np.abs(pa - pb).sum())
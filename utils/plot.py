@@ -1,13 +1,19 @@
-import matplotlib
-matplotlib.use('Agg')  # Non-interactive backend
-import matplotlib.pyplot as plt
 from io import BytesIO
 import numpy as np
 from PIL import Image
 import hashlib
 
-# Cache cho histogram để tránh tính toán lại
-_histogram_cache = {}
+from .memory import GovernedCache
+
+# Cache cho histogram để tránh tính toán lại (LRU, giới hạn bởi governor bộ nhớ)
+_histogram_cache = GovernedCache("histogram", max_items=32)
+
+def _pyplot():
+    """Import matplotlib lazy (chỉ khi vẽ histogram lần đầu) để app khởi động nhanh"""
+    import matplotlib
+    matplotlib.use('Agg')  # Non-interactive backend
+    import matplotlib.pyplot as plt
+    return plt
 
 def get_image_hash(img):
     """Tạo hash của ảnh để cache"""
@@ -16,6 +22,7 @@ def get_image_hash(img):
 def plot_histogram_cached(img_hash, img_shape, hist_data):
     """Vẽ histogram với cache đơn giản"""
     try:
+        plt = _pyplot()
         fig, ax = plt.subplots(figsize=(5, 2.5))
         
         bin_centers, hist = hist_data
@@ -32,50 +39,121 @@ def plot_histogram_cached(img_hash, img_shape, hist_data):
     except Exception:
         return Image.new('RGB', (400, 200), 'white')
 
-def plot_histogram(img):
+def _to_gray(img):
+    # Tính theo từng phần tử (không qua np.dot/BLAS) để kết quả không phụ thuộc hình dạng
+    # mảng: bảng màu (N, 3) và ảnh (H, W, 3) cho cùng mức xám (xem lut_histogram)
+    return (img[..., 0] * 0.299 + img[..., 1] * 0.587 + img[..., 2] * 0.114).astype(np.uint8)
+
+def _histogram_sample(img, pyramid=None):
+    """
+    Mẫu ảnh dùng để tính histogram (giữ nguyên số kênh):
+    - có pyramid và ảnh lớn: mức pyramid <= 200K pixel
+    - không có pyramid và ảnh lớn: lấy mẫu cách `step` pixel
+    """
+    if img.shape[0] * img.shape[1] <= 500000:
+        return img
+    if pyramid is not None:
+        return pyramid.level_for_pixels(200000)
+    step = int(np.sqrt(img.shape[0] * img.shape[1] / 100000))
+    return img[::step, ::step]
+
+def image_histogram(img, pyramid=None):
+    """
+    Histogram 256 bin (của ảnh xám) dùng để hiển thị.
+
+    Args:
+        pyramid: ImagePyramid của `img` (utils.pyramid). Nếu có, ảnh lớn dùng mức
+            pyramid đã tạo sẵn thay vì lấy mẫu cách quãng, và histogram được nhớ trên
+            pyramid (không cần hash lại ảnh). Chỉ nên truyền cho ảnh gốc: trung bình
+            khối làm ảnh nhị phân xuất hiện các mức xám trung gian.
+    """
+    def compute():
+        sample = _histogram_sample(img, pyramid)
+        if len(sample.shape) == 3:
+            sample = _to_gray(sample)
+        return np.bincount(sample.ravel(), minlength=256)
+
+    if pyramid is not None:
+        return pyramid.memo("histogram", compute)
+
+    # Chuyển xám trước khi hash (giữ nguyên khóa cache như trước)
+    if len(img.shape) == 3:
+        img = _to_gray(img)
+    img_hash = get_image_hash(img)
+    hist = _histogram_cache.get(img_hash)
+    if hist is None:
+        hist = compute()
+        _histogram_cache[img_hash] = hist
+    return hist
+
+def _color_table(img, pyramid=None):
+    """Các màu khác nhau trong mẫu histogram của ảnh màu và số lần xuất hiện"""
+    def compute():
+        sample = _histogram_sample(img, pyramid)[..., :3]
+        packed = (sample[..., 0].astype(np.uint32) << 16) | (sample[..., 1].astype(np.uint32) << 8) | sample[..., 2]
+        values, counts = np.unique(packed.ravel(), return_counts=True)
+        colors = np.stack([values >> 16, (values >> 8) & 255, values & 255], axis=1).astype(np.uint8)
+        return colors, counts
+
+    if pyramid is not None:
+        return pyramid.memo("color_table", compute)
+    return compute()
+
+def lut_histogram(img, lut, pyramid=None):
     """
-    Vẽ histogram với caching và tối ưu hóa
+    Histogram 256 bin của `lut` áp dụng lên `img`, suy ra mà không quét ảnh kết quả.
+
+    - Ảnh xám: đẩy histogram đầu vào qua LUT - O(256)
+    - Ảnh màu: histogram hiển thị là của ảnh xám (tổ hợp 3 kênh) nên không suy ra được
+      từ histogram xám đầu vào; thay vào đó áp LUT lên bảng màu của mẫu histogram
+      (nhớ trên pyramid) - O(số màu khác nhau), không phụ thuộc kích thước ảnh
     """
+    lut = np.asarray(lut)
+    if len(img.shape) == 2:
+        return np.bincount(lut, weights=image_histogram(img, pyramid), minlength=256).astype(np.int64)
+    colors, counts = _color_table(img, pyramid)
+    return np.bincount(_to_gray(lut[colors]), weights=counts, minlength=256).astype(np.int64)
+
+def plot_histogram_counts(hist):
+    """Vẽ histogram 256 bin (gộp thành 128 cột như plot_histogram)"""
     try:
-        # Chuyển sang grayscale nếu là ảnh màu
-        if len(img.shape) == 3:
-            img = np.dot(img[...,:3], [0.299, 0.587, 0.114]).astype(np.uint8)
-        
-        # Tạo hash để cache
-        img_hash = get_image_hash(img)
-        
-        # Kiểm tra cache
-        if img_hash in _histogram_cache:
-            return _histogram_cache[img_hash]
-        
-        # Downsample nếu ảnh quá lớn
-        if img.size > 500000:
-            step = int(np.sqrt(img.size / 100000))
-            img = img[::step, ::step]
-        
-        # Tính histogram
-        hist, bins = np.histogram(img.ravel(), bins=128, range=(0,256))
-        bin_centers = (bins[:-1] + bins[1:]) / 2
-        
-        # Vẽ với cache
-        result = plot_histogram_cached(img_hash, img.shape, (bin_centers, hist))
-        
-        # Lưu vào cache (giới hạn 10 items)
-        if len(_histogram_cache) > 10:
-            _histogram_cache.clear()
-        _histogram_cache[img_hash] = result
-        
+        hist = np.asarray(hist, dtype=np.int64)
+        key = "counts:" + hashlib.md5(hist.tobytes()).hexdigest()[:16]
+        result = _histogram_cache.get(key)
+        if result is not None:
+            return result
+        bin_centers = np.arange(128) * 2 + 1.0
+        result = plot_histogram_cached(key, None, (bin_centers, hist.reshape(128, 2).sum(axis=1)))
+        _histogram_cache[key] = result
         return result
-    
+    except Exception as e:
+        print(f"Lỗi plot_histogram_counts: {e}")
+        return Image.new('RGB', (400, 200), 'white')
+
+def plot_histogram(img, pyramid=None):
+    """
+    Vẽ histogram với caching và tối ưu hóa (xem image_histogram về `pyramid`)
+    """
+    try:
+        return plot_histogram_counts(image_histogram(img, pyramid))
     except Exception as e:
         print(f"Lỗi plot_histogram: {e}")
         return Image.new('RGB', (400, 200), 'white')
 
+def plot_lut_histogram(img, lut, pyramid=None):
+    """Vẽ histogram sau phép biến đổi điểm `lut` mà không quét lại ảnh kết quả"""
+    try:
+        return plot_histogram_counts(lut_histogram(img, lut, pyramid))
+    except Exception as e:
+        print(f"Lỗi plot_lut_histogram: {e}")
+        return Image.new('RGB', (400, 200), 'white')
+
 def plot_histogram_streamlit(img):
     """
     Vẽ histogram trực tiếp cho Streamlit
     Trả về matplotlib figure
     """
+    plt = _pyplot()
     fig, ax = plt.subplots(figsize=(8, 4))
     
     # Kiểm tra ảnh màu hay xám
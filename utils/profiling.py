@@ -0,0 +1,279 @@
+"""
+Profiling tùy chọn cho các lần chạy pipeline: xem thời gian đi vào đâu trong `processing/*`.
+
+Hai chế độ:
+- "sample":   thread lấy mẫu stack mỗi `interval` giây (sys._current_frames), chi phí thấp,
+              thấy cả các thread worker do phép xử lý tạo ra (tile_histograms, map_tiles) -
+              thread pool đặt tên bằng `worker_thread_prefix()` để gắn với thread gọi.
+              Xuất collapsed stack (.folded - dùng được với flamegraph.pl / speedscope) và
+              flame graph .svg.
+- "cprofile": cProfile của thread gọi - số lần gọi chính xác, chi phí cao hơn với các hàm
+              nhỏ. Xuất .prof (python -m pstats / snakeviz). Mỗi lúc chỉ một lần chạy dùng
+              cProfile; khi nó đang bận (lần profile khác, hoặc công cụ khác như debugger /
+              coverage trên Python 3.12+) thì lần chạy này lấy mẫu stack - report.mode cho biết
+              chế độ thực tế.
+
+Khi tắt (mode=None), `profiled` trả về nullcontext - không tốn gì thêm.
+
+    with profiled("sample") as report:
+        result = run_pipeline("clahe", img)
+    report.top(10)                 # các hàm tốn thời gian nhất
+    report.write("profiles", "clahe")
+"""
+import cProfile
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+MODES = ("sample", "cprofile")
+# Chỉ giữ các frame thuộc project (frame ngoài cùng bên ngoài project bị bỏ)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Tên thread worker: "<prefix><ident thread gốc>_<số thứ tự>" (ThreadPoolExecutor thêm "_i")
+WORKER_PREFIX = "pipeline-worker-"
+# Python 3.12+ chỉ cho một profiler bật mỗi lúc ("Another profiling tool is already active"):
+# các lần profile "cprofile" song song (nhiều session / job) không chạy chồng lên nhau
+_cprofile_lock = threading.Lock()
+
+
+def worker_thread_prefix():
+    """
+    thread_name_prefix cho thread pool của phép xử lý: gắn ident của thread gốc đã gọi
+    phép xử lý (kể cả khi pool được tạo từ một worker khác) để sampler chỉ lấy mẫu các
+    worker của đúng lần chạy đang profile, không lấy thread của session khác.
+    """
+    name = threading.current_thread().name
+    if name.startswith(WORKER_PREFIX):
+        root = name[len(WORKER_PREFIX):].split("_", 1)[0]
+    else:
+        root = threading.get_ident()
+    return f"{WORKER_PREFIX}{root}"
+
+
+def _frame_file(filename):
+    """Đường dẫn tương đối với project, None nếu file không thuộc project"""
+    path = os.path.abspath(filename)
+    if not path.startswith(ROOT + os.sep):
+        return None
+    return os.path.relpath(path, ROOT).replace(os.sep, "/")
+
+
+def _label(filename, name):
+    return f"{_frame_file(filename) or os.path.basename(filename)}:{name}"
+
+
+class _StackSampler(threading.Thread):
+    """
+    Lấy mẫu stack của thread gọi và các worker của nó (thread tên bắt đầu bằng
+    worker_thread_prefix() của thread gọi). Thread của session khác - kể cả worker
+    chúng tạo ra trong lúc profile - không bị lấy mẫu.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.target = threading.get_ident()
+        self.worker_prefix = f"{WORKER_PREFIX}{self.target}_"
+        self.stacks = Counter()
+        self.ticks = 0
+        self._stop_event = threading.Event()
+
+    def _sampled(self):
+        # ident của thread gọi và các worker của nó đang chạy
+        return {self.target} | {t.ident for t in threading.enumerate()
+                                if t.name.startswith(self.worker_prefix)}
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.ticks += 1
+            sampled = self._sampled()
+            for ident, frame in sys._current_frames().items():
+                if ident not in sampled:
+                    continue
+                stack = self._stack(frame)
+                if stack:
+                    self.stacks[stack] += 1
+
+    @staticmethod
+    def _stack(frame):
+        # Từ frame ngoài cùng vào trong, bỏ các frame bên ngoài project ở phía ngoài
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            labels.append((code.co_filename, getattr(code, "co_qualname", code.co_name)))
+            frame = frame.f_back
+        labels.reverse()
+        for start, (filename, _) in enumerate(labels):
+            if _frame_file(filename) is not None:
+                return ";".join(_label(f, n) for f, n in labels[start:])
+        return None
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class ProfileReport:
+    """Kết quả một lần profiling: bảng theo hàm, collapsed stack, file xuất ra"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.elapsed = 0.0
+        self.functions = []  # dict: function, calls, self_s, total_s
+        self.stacks = Counter()  # collapsed stack -> số mẫu (chế độ sample)
+        self.pstats_data = None  # bytes của file .prof (chế độ cprofile)
+
+    def _from_samples(self, sampler):
+        self.stacks = sampler.stacks
+        # Mỗi mẫu ~ thời gian thực / số lần lấy mẫu
+        tick = self.elapsed / max(sampler.ticks, 1)
+        self_count, total_count = Counter(), Counter()
+        for stack, count in sampler.stacks.items():
+            frames = stack.split(";")
+            self_count[frames[-1]] += count
+            for name in set(frames):
+                total_count[name] += count
+        self.functions = [{"function": name, "calls": None, "self_s": self_count[name] * tick,
+                           "total_s": count * tick} for name, count in total_count.items()]
+
+    def _from_cprofile(self, profiler):
+        profiler.create_stats()
+        self.pstats_data = marshal.dumps(profiler.stats)
+        for (filename, _, name), (_, calls, tottime, cumtime, _) in pstats.Stats(profiler).stats.items():
+            self.functions.append({"function": _label(filename, name), "calls": calls,
+                                   "self_s": tottime, "total_s": cumtime})
+
+    def top(self, n=15, key="self_s"):
+        """n hàm tốn thời gian nhất (theo thời gian riêng `self_s` hoặc gồm hàm con `total_s`)"""
+        return sorted(self.functions, key=lambda row: row[key], reverse=True)[:n]
+
+    def collapsed(self):
+        """Collapsed stack: mỗi dòng "a;b;c số_mẫu" (đầu vào của flamegraph.pl)"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def flamegraph_svg(self, width=1200, row_height=16):
+        """Flame graph SVG dựng từ collapsed stack (gốc ở dưới, rê chuột xem tên hàm)"""
+        return flamegraph_svg(self.stacks, width, row_height)
+
+    def write(self, directory, name):
+        """Ghi các file của report vào `directory`; trả về danh sách đường dẫn"""
+        os.makedirs(directory, exist_ok=True)
+        outputs = {}
+        if self.stacks:
+            outputs[".folded"] = self.collapsed().encode("utf-8")
+            outputs[".svg"] = self.flamegraph_svg().encode("utf-8")
+        if self.pstats_data is not None:
+            outputs[".prof"] = self.pstats_data
+        paths = []
+        for ext, data in outputs.items():
+            path = os.path.join(directory, name + ext)
+            with open(path, "wb") as f:
+                f.write(data)
+            paths.append(path)
+        return paths
+
+    def format_table(self, n=15):
+        """Bảng văn bản các hàm nóng nhất (cho CLI)"""
+        lines = [f"{self.mode}: {self.elapsed * 1000:.1f} ms",
+                 f"{'self ms':>9} {'total ms':>9} {'calls':>8}  function"]
+        for row in self.top(n):
+            calls = "" if row["calls"] is None else row["calls"]
+            lines.append(f"{row['self_s'] * 1000:>9.1f} {row['total_s'] * 1000:>9.1f} {calls:>8}  {row['function']}")
+        return "\n".join(lines)
+
+
+def profiled(mode=None, interval=0.005):
+    """
+    Context manager profiling đoạn code bên trong, trả về ProfileReport (điền khi thoát).
+    mode=None: không profiling (nullcontext, giá trị là None).
+    """
+    if mode is None:
+        return nullcontext()
+    if mode not in MODES:
+        raise ValueError(f"mode phải là một trong {MODES}")
+    return _profiled(mode, interval)
+
+
+def _start_cprofile():
+    """cProfile.Profile đã bật (giữ _cprofile_lock), hoặc None nếu profiler đang bận"""
+    if not _cprofile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # công cụ khác đang giữ profiler (sys.monitoring)
+        _cprofile_lock.release()
+        return None
+    return profiler
+
+
+@contextmanager
+def _profiled(mode, interval):
+    profiler = _start_cprofile() if mode == "cprofile" else None
+    report = ProfileReport("cprofile" if profiler is not None else "sample")
+    if profiler is not None:
+        t0 = time.perf_counter()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            _cprofile_lock.release()
+            report.elapsed = time.perf_counter() - t0
+            report._from_cprofile(profiler)
+    else:
+        sampler = _StackSampler(interval)
+        t0 = time.perf_counter()
+        sampler.start()
+        try:
+            yield report
+        finally:
+            sampler.stop()
+            report.elapsed = time.perf_counter() - t0
+            report._from_samples(sampler)
+
+
+def _escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def flamegraph_svg(stacks, width=1200, row_height=16):
+    """Flame graph SVG từ Counter collapsed stack -> số mẫu"""
+    # Cây: tên -> [số mẫu, cây con]
+    root = [0, {}]
+    for stack, count in stacks.items():
+        root[0] += count
+        node = root
+        for name in stack.split(";"):
+            node = node[1].setdefault(name, [0, {}])
+            node[0] += count
+
+    def depth(node):
+        return 1 + max((depth(child) for child in node[1].values()), default=0)
+
+    height = depth(root) * row_height + 4
+    total = max(root[0], 1)
+    rects = []
+
+    def layout(node, x, level):
+        for name, child in sorted(node[1].items()):
+            w = child[0] / total * width
+            if w >= 0.5:
+                y = height - (level + 1) * row_height
+                hue = zlib.crc32(name.encode("utf-8")) % 60
+                label = _escape(name.split(":")[-1]) if w > 40 else ""
+                rects.append(
+                    f'<g><title>{_escape(name)} ({child[0]} mẫu, {100 * child[0] / total:.1f}%)</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" '
+                    f'fill="hsl({hue},85%,60%)"/>'
+                    f'<text x="{x + 3:.1f}" y="{y + row_height - 4}" font-size="11">{label[:int(w / 7)]}</text></g>')
+                layout(child, x, level + 1)
+            x += w
+
+    layout(root, 0.0, 0)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'font-family="monospace">{"".join(rects)}</svg>\n')
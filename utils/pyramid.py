@@ -0,0 +1,152 @@
+"""
+Kim tự tháp ảnh (image pyramid) dùng chung cho preview, histogram và các bước thu nhỏ.
+
+Mỗi mức nhỏ hơn mức trước 2 lần mỗi chiều, tính bằng trung bình khối 2x2 (area
+averaging) từ mức liền trước - không ai phải thu nhỏ lại từ độ phân giải gốc.
+Các mức chỉ được tạo khi có người cần (lazy).
+
+    pyr = pyramid_for(img)                    # dùng chung cho cùng một mảng img
+    small = pyr.level_for_pixels(100000)      # mức lớn nhất có <= 100K pixel
+    src = pyr.level_for_pixels(1000000, above=True)  # mức nhỏ nhất có >= 1M pixel
+
+Các mức và giá trị memo được đăng ký với governor bộ nhớ (utils.memory): khi vượt
+ngân sách chúng có thể bị bỏ và sẽ được tạo lại khi cần.
+"""
+import itertools
+import threading
+import weakref
+
+import numpy as np
+
+from .memory import governor, sizeof, weak_callback
+
+_pyramid_ids = itertools.count()
+
+
+def _downsample2x(img):
+    """Trung bình khối 2x2 (bỏ hàng/cột lẻ cuối cùng)"""
+    h, w = img.shape[0] // 2 * 2, img.shape[1] // 2 * 2
+    a = img[:h, :w]
+    if img.dtype == np.uint8:
+        acc = a[0::2, 0::2].astype(np.uint16)
+        acc += a[1::2, 0::2]
+        acc += a[0::2, 1::2]
+        acc += a[1::2, 1::2]
+        return ((acc + 2) >> 2).astype(np.uint8)
+    acc = (a[0::2, 0::2].astype(np.float32) + a[1::2, 0::2] + a[0::2, 1::2] + a[1::2, 1::2]) / 4
+    return acc.astype(img.dtype)
+
+
+class ImagePyramid:
+    def __init__(self, img, min_side=16, weak_base=False):
+        # weak_base: không giữ ảnh gốc sống (dùng cho registry `pyramid_for`)
+        self._base = weakref.ref(img) if weak_base else (lambda: img)
+        self._levels = []  # các mức 1, 2, ... đã tạo
+        self._memo = {}  # đại lượng suy ra từ ảnh (ảnh xám, histogram...) - xem memo()
+        self._lock = threading.Lock()
+        self.min_side = min_side
+        self.owner = f"pyramid:{next(_pyramid_ids)}"
+        weakref.finalize(self, governor().forget_owner, self.owner)
+
+    @property
+    def base(self):
+        return self._base()
+
+    def _can_shrink(self, img):
+        return min(img.shape[:2]) // 2 >= self.min_side
+
+    def level(self, k):
+        """Mức thứ k (0 = ảnh gốc); dừng ở mức nhỏ nhất nếu k quá lớn"""
+        base = self.base
+        if k == 0:
+            return base
+        with self._lock:
+            built = len(self._levels)
+            while len(self._levels) < k:
+                last = self._levels[-1] if self._levels else base
+                if not self._can_shrink(last):
+                    break
+                self._levels.append(_downsample2x(last))
+            result = self._levels[min(k, len(self._levels)) - 1] if self._levels else base
+            grew = len(self._levels) > built
+            nbytes = sum(level.nbytes for level in self._levels)
+        if grew:
+            governor().track(self.owner, "levels", nbytes, weak_callback(self, "_drop_levels"))
+        else:
+            governor().touch(self.owner, "levels")
+        return result
+
+    def level_for_pixels(self, max_pixels, above=False):
+        """
+        Mức gần với ngân sách `max_pixels` nhất:
+        - mặc định: mức lớn nhất có số pixel <= max_pixels (hoặc mức nhỏ nhất nếu không có)
+        - above=True: mức nhỏ nhất có số pixel >= max_pixels - dùng làm nguồn cho một
+          phép resize chính xác tới max_pixels thay vì resize từ ảnh gốc
+        """
+        k = 0
+        current = self.level(0)
+        while True:
+            # Mặc định dừng ngay khi mức hiện tại vừa ngân sách - không tạo thêm mức sau
+            if not above and current.shape[0] * current.shape[1] <= max_pixels:
+                return current
+            nxt = self.level(k + 1)
+            if nxt is current:  # đã tới mức nhỏ nhất
+                return current
+            if above and nxt.shape[0] * nxt.shape[1] < max_pixels:
+                return current
+            current = nxt
+            k += 1
+
+    def memo(self, key, compute):
+        """
+        Giá trị `compute()` tính một lần cho ảnh này (ví dụ ảnh xám, histogram) và dùng
+        lại ở các lần sau mà không cần hash lại ảnh
+        """
+        with self._lock:
+            if key in self._memo:
+                value = self._memo[key]
+                hit = True
+            else:
+                hit = False
+        if hit:
+            governor().touch(self.owner, ("memo", key))
+            return value
+        value = compute()
+        with self._lock:
+            value = self._memo.setdefault(key, value)
+        governor().track(self.owner, ("memo", key), sizeof(value), weak_callback(self, "_drop_memo", key))
+        return value
+
+    def _drop_levels(self):
+        # Governor bỏ các mức đã tạo (sẽ tạo lại khi cần)
+        with self._lock:
+            self._levels = []
+
+    def _drop_memo(self, key):
+        with self._lock:
+            self._memo.pop(key, None)
+
+    @property
+    def nbytes(self):
+        """Bộ nhớ đang dùng bởi các mức đã tạo (không tính ảnh gốc)"""
+        with self._lock:
+            return sum(level.nbytes for level in self._levels)
+
+
+# Pyramid dùng chung theo đối tượng mảng: mọi consumer nhận cùng một mảng sẽ
+# dùng chung các mức đã tạo. Tự xóa khi mảng gốc bị thu hồi.
+_pyramids = {}
+_pyramids_lock = threading.Lock()
+
+
+def pyramid_for(img):
+    """Pyramid dùng chung cho mảng `img` (tạo mới nếu chưa có)"""
+    key = id(img)
+    with _pyramids_lock:
+        entry = _pyramids.get(key)
+        if entry is not None and entry[0]() is img:
+            return entry[1]
+        pyramid = ImagePyramid(img, weak_base=True)
+        ref = weakref.ref(img, lambda _, key=key: _pyramids.pop(key, None))
+        _pyramids[key] = (ref, pyramid)
+        return pyramid